@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
     'drf_yasg',
@@ -51,6 +52,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'habits.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -140,8 +142,22 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'habits.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'habits.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', 1024))
+
+HABIT_BATCH_MAX_SIZE = int(os.getenv('HABIT_BATCH_MAX_SIZE', 100))
+HABIT_EXPORT_CHUNK_SIZE = int(os.getenv('HABIT_EXPORT_CHUNK_SIZE', 2000))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
@@ -150,13 +166,60 @@ SIMPLE_JWT = {
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL')
 CELERY_RESULT_BACKEND = os.getenv('CELERY_BROKER_URL')
 
+CACHE_URL = os.getenv('CACHE_URL', CELERY_BROKER_URL)
+
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+
+PUBLIC_FEED_CACHE_TIMEOUT = int(os.getenv('PUBLIC_FEED_CACHE_TIMEOUT', 3600))
+OWN_HABITS_CACHE_TIMEOUT = int(os.getenv('OWN_HABITS_CACHE_TIMEOUT', 86400))
+
+NOTIFICATION_SCHEDULER = os.getenv('NOTIFICATION_SCHEDULER', 'beat')
+NOTIFICATION_TIMER_WHEEL_URL = os.getenv('NOTIFICATION_TIMER_WHEEL_URL', CELERY_BROKER_URL)
+NOTIFICATION_SHARDS = int(os.getenv('NOTIFICATION_SHARDS', 4))
+NOTIFICATION_CATCH_UP_POLICY = os.getenv('NOTIFICATION_CATCH_UP_POLICY', 'notify')
+NOTIFICATION_CLAIM_BATCH_SIZE = int(os.getenv('NOTIFICATION_CLAIM_BATCH_SIZE', 1000))
+NOTIFICATION_OUTBOX_BATCH_SIZE = int(os.getenv('NOTIFICATION_OUTBOX_BATCH_SIZE', 500))
+NOTIFICATION_OUTBOX_LEASE = timedelta(seconds=int(os.getenv('NOTIFICATION_OUTBOX_LEASE_SECONDS', 300)))
+NOTIFICATION_OUTBOX_MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_OUTBOX_MAX_ATTEMPTS', 5))
+NOTIFICATION_OUTBOX_RETRY_BACKOFF = timedelta(seconds=int(os.getenv('NOTIFICATION_OUTBOX_RETRY_BACKOFF_SECONDS', 30)))
+
 CELERY_BEAT_SCHEDULE = {
     'task-name': {
         'task': 'habits.tasks.send_notifications',
         'schedule': timedelta(minutes=1),
     },
+    'catch-up-notifications': {
+        'task': 'habits.tasks.catch_up_notifications',
+        'schedule': timedelta(minutes=15),
+    },
+    'drain-notification-outbox': {
+        'task': 'habits.tasks.drain_notification_outbox',
+        'schedule': timedelta(seconds=30),
+    },
 }
 
+if NOTIFICATION_SCHEDULER == 'timer_wheel':
+    # Due habits are popped from the Redis timer wheel by 'manage.py run_timer_wheel' instead of polling.
+    del CELERY_BEAT_SCHEDULE['task-name']
+
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
+TELEGRAM_MAX_CONCURRENCY = int(os.getenv('TELEGRAM_MAX_CONCURRENCY', 50))
+TELEGRAM_GLOBAL_RATE_LIMIT = float(os.getenv('TELEGRAM_GLOBAL_RATE_LIMIT', 30))
+TELEGRAM_CHAT_RATE_LIMIT = float(os.getenv('TELEGRAM_CHAT_RATE_LIMIT', 1))
+TELEGRAM_REQUEST_TIMEOUT = float(os.getenv('TELEGRAM_REQUEST_TIMEOUT', 10))
+TELEGRAM_MIN_RATE_LIMIT = float(os.getenv('TELEGRAM_MIN_RATE_LIMIT', 1))
+TELEGRAM_RATE_INCREASE = float(os.getenv('TELEGRAM_RATE_INCREASE', 0.1))
+TELEGRAM_SEND_RETRIES = int(os.getenv('TELEGRAM_SEND_RETRIES', 2))
+TELEGRAM_MAX_RETRY_AFTER = float(os.getenv('TELEGRAM_MAX_RETRY_AFTER', 10))
+TELEGRAM_BREAKER_THRESHOLD = int(os.getenv('TELEGRAM_BREAKER_THRESHOLD', 10))
+TELEGRAM_BREAKER_RECOVERY = int(os.getenv('TELEGRAM_BREAKER_RECOVERY_SECONDS', 30))
+
 CORS_ALLOWED_ORIGINS = [
     'http://localhost:8000',
 ]
@@ -1,6 +1,7 @@
 from django.contrib import admin
+from django.utils import timezone
 
-from habits.models import Habit
+from habits.models import Habit, NotificationOutbox
 
 
 # Register your models here.
@@ -10,3 +11,15 @@ class CourseAdmin(admin.ModelAdmin):
     list_filter = ('periodicity', 'is_pleasant', 'is_public')
     search_fields = ('action', )
     ordering = ('-id',)
+
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ('id', 'owner', 'chat_id', 'status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at')
+    list_filter = ('status',)
+    ordering = ('-id',)
+    actions = ('requeue',)
+
+    @admin.action(description='Send selected notifications again')
+    def requeue(self, request, queryset):
+        queryset.update(status=NotificationOutbox.PENDING, attempts=0, next_attempt_at=timezone.now())
@@ -0,0 +1,24 @@
+from itertools import islice
+
+from django.conf import settings
+
+from habits.serializers import HabitExportSerializer, ValuesSerializer
+
+
+def export_habits(queryset, renderer, chunk_size=None):
+    """
+    Yield the habits of 'queryset' in the order of their id, rendered by 'renderer' in chunks of 'chunk_size' rows.
+
+    The habits are read with a server-side cursor and serialized from values() rows one chunk at a time, so the
+    memory used does not depend on the number of habits and the header is yielded before the first query runs.
+    """
+
+    chunk_size = chunk_size or settings.HABIT_EXPORT_CHUNK_SIZE
+    serializer = ValuesSerializer(HabitExportSerializer())
+    header = renderer.render_header(list(serializer.names))
+    if header:
+        yield header
+
+    rows = queryset.order_by('id').values(*serializer.sources).iterator(chunk_size=chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        yield renderer.render_rows(serializer.to_representation(chunk))
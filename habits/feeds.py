@@ -0,0 +1,173 @@
+import hashlib
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+
+from habits.models import Habit
+from habits.serializers import HabitListSerializer, ValuesSerializer
+
+PUBLIC_FEED_KEY = 'habits:public_feed'
+OWN_HABITS_KEY = 'habits:own'
+FILL_LOCK_TIMEOUT = 10
+FILL_WAIT = 0.05
+FILL_WAIT_ATTEMPTS = 20
+BLOCKS_PER_READ = 8
+
+
+def get_or_fill(key, loader, timeout):
+    """
+    Return the value cached under 'key', calling 'loader' to fill it on a miss.
+
+    Only one process refills a missing key at a time: the others wait for it for up to a second and load the value
+    themselves, without caching it, if it does not show up by then.
+    """
+
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, timeout=FILL_LOCK_TIMEOUT):
+        try:
+            value = loader()
+            cache.set(key, value, timeout=timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    for _ in range(FILL_WAIT_ATTEMPTS):
+        time.sleep(FILL_WAIT)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    return loader()
+
+
+class PublicHabitFeed:
+    """
+    The serialized list of public habits, shared by all users through the Django cache.
+
+    The feed is cached in blocks of 'block_size' consecutive habit ids, each a list of (id, owner_id, data) rows
+    where 'data' is the HabitListSerializer representation. All keys carry the feed version, which invalidate()
+    replaces whenever a public habit is created, changed or deleted, so a stale block is never read again. Pages are
+    cut from the blocks per request, which is where the viewer's own habits are left out.
+    """
+
+    block_size = 1000
+
+    @staticmethod
+    def get_version():
+        version = cache.get(f'{PUBLIC_FEED_KEY}:version')
+        if version is None:
+            cache.add(f'{PUBLIC_FEED_KEY}:version', time.time_ns(), timeout=None)
+            version = cache.get(f'{PUBLIC_FEED_KEY}:version')
+        return version
+
+    @staticmethod
+    def invalidate():
+        """ Start a new version of the feed. """
+
+        cache.set(f'{PUBLIC_FEED_KEY}:version', time.time_ns(), timeout=None)
+
+    def __init__(self):
+        self.version = self.get_version()
+        self.timeout = settings.PUBLIC_FEED_CACHE_TIMEOUT
+
+    def page(self, position, reverse, size, exclude_owner):
+        """
+        Return up to 'size' rows after the habit id 'position', or before it when 'reverse', that are not owned by
+        'exclude_owner', in the order they are read, and whether there are more.
+        """
+
+        last_block = self.get_max_id() // self.block_size
+        if position is None:
+            block = last_block if reverse else 0
+        else:
+            block = min(position // self.block_size, last_block) if reverse else position // self.block_size
+
+        rows = []
+        while 0 <= block <= last_block and len(rows) <= size:
+            blocks = range(block, max(block - BLOCKS_PER_READ, -1), -1) if reverse \
+                else range(block, min(block + BLOCKS_PER_READ, last_block + 1))
+            for block_rows in self.get_blocks(blocks):
+                for row in reversed(block_rows) if reverse else block_rows:
+                    habit_id, owner_id, data = row
+                    if owner_id == exclude_owner or position is not None and (
+                            habit_id >= position if reverse else habit_id <= position):
+                        continue
+                    rows.append(row)
+            block = blocks[-1] + (-1 if reverse else 1)
+
+        return rows[:size], len(rows) > size
+
+    def get_max_id(self):
+        return get_or_fill(self.key('max_id'), self.load_max_id, self.timeout)
+
+    def get_blocks(self, blocks):
+        keys = [self.key(block) for block in blocks]
+        cached = cache.get_many(keys)
+        return [
+            cached[key] if key in cached else get_or_fill(key, partial(self.load_block, block), self.timeout)
+            for block, key in zip(blocks, keys)
+        ]
+
+    def key(self, name):
+        return f'{PUBLIC_FEED_KEY}:{self.version}:{name}'
+
+    @staticmethod
+    def load_max_id():
+        return Habit.objects.filter(is_public=True).aggregate(max_id=Max('id'))['max_id'] or 0
+
+    def load_block(self, block):
+        rows = list(
+            Habit.objects.filter(is_public=True, id__gte=block * self.block_size, id__lt=(block + 1) * self.block_size)
+            .order_by('id')
+            .values('id', 'owner_id', *HabitListSerializer.Meta.fields)
+        )
+        data = ValuesSerializer(HabitListSerializer()).to_representation(rows)
+        return [(row['id'], row['owner_id'], habit) for row, habit in zip(rows, data)]
+
+
+class OwnHabitsCache:
+    """
+    Cached responses of a user's own habits list.
+
+    Every user has a version of their list in the Django cache, replaced by invalidate() whenever one of their
+    habits is written. Pages are cached under the current version, so a page is never served after a change and
+    unchanged lists are served without touching the database.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+
+    def get_version(self):
+        version_key = f'{OWN_HABITS_KEY}:{self.user_id}:version'
+        version = cache.get(version_key)
+        if version is None:
+            cache.add(version_key, time.time_ns(), timeout=None)
+            version = cache.get(version_key)
+        return version
+
+    def invalidate(self):
+        """ Start a new version of the user's list. """
+
+        cache.set(f'{OWN_HABITS_KEY}:{self.user_id}:version', time.time_ns(), timeout=None)
+
+    def get_page(self, url, loader):
+        """
+        Return the page of the list requested with 'url', calling 'loader' to build it if it is not cached.
+
+        The version is read before the page is built, so a page built while the list changes is stored under the
+        old version and never served.
+        """
+
+        url_hash = hashlib.md5(url.encode()).hexdigest()
+        key = f'{OWN_HABITS_KEY}:{self.user_id}:{self.get_version()}:{url_hash}'
+        data = cache.get(key)
+        if data is None:
+            data = loader()
+            cache.set(key, data, timeout=settings.OWN_HABITS_CACHE_TIMEOUT)
+        return data
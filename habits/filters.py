@@ -0,0 +1,78 @@
+from rest_framework import fields
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from habits.serializers import PERIODICITY_VALID_VALUES
+
+ORDERING_PARAM = 'ordering'
+ORDERINGS = {
+    'id': ('id',),
+    'time': ('time', 'id'),
+    '-time': ('-time', '-id'),
+}
+
+FILTER_PARAMS = {
+    'periodicity': ('periodicity', 'periodicity', fields.ChoiceField(choices=PERIODICITY_VALID_VALUES)),
+    'is_pleasant': ('is_pleasant', 'is_pleasant', fields.BooleanField()),
+    'is_public': ('is_public', 'is_public', fields.BooleanField()),
+    'time_after': ('time', 'time__gte', fields.TimeField()),
+    'time_before': ('time', 'time__lt', fields.TimeField()),
+}
+
+
+class IndexedHabitFilter(BaseFilterBackend):
+    """
+    Filter and order habit lists by whitelisted query parameters.
+
+    The view's 'filter_indexes' maps every allowed combination of filtered fields and ordering to the index that
+    serves it, e.g. {(('periodicity',), 'id'): 'habits_owner_periodicity_idx'}. Query parameters that are not
+    whitelisted are ignored, invalid values and combinations without an index are rejected with 400, so no request can
+    make the database scan the whole table.
+    """
+
+    def parse(self, request, view):
+        """ Return the filter lookups and the ordering requested, and the name of the index that serves them. """
+
+        lookups = {}
+        filtered_fields = set()
+        errors = {}
+
+        for param, value in request.query_params.items():
+            if param == ORDERING_PARAM or param not in FILTER_PARAMS:
+                continue
+            field_name, lookup, field = FILTER_PARAMS[param]
+            try:
+                lookups[lookup] = field.run_validation(value)
+            except ValidationError as e:
+                errors[param] = e.detail
+            filtered_fields.add(field_name)
+
+        ordering = request.query_params.get(ORDERING_PARAM, 'id')
+        if ordering not in ORDERINGS:
+            errors[ORDERING_PARAM] = [f'Valid values are: {", ".join(ORDERINGS)}']
+        if errors:
+            raise ValidationError(errors)
+
+        combination = (tuple(sorted(filtered_fields)), ordering.lstrip('-'))
+        index = view.filter_indexes.get(combination)
+        if index is None:
+            allowed = '; '.join(
+                f'{" + ".join(fields) or "no filter"} ordered by {order}' for fields, order in view.filter_indexes
+            )
+            raise ValidationError({'detail': f'This combination of filters and ordering is not supported. '
+                                             f'Supported combinations: {allowed}'})
+        return lookups, ORDERINGS[ordering], index
+
+    @staticmethod
+    def is_filtered(request):
+        """ Whether the request asks for any filter or ordering. """
+
+        return any(param == ORDERING_PARAM or param in FILTER_PARAMS for param in request.query_params)
+
+    def filter_queryset(self, request, queryset, view):
+        lookups, ordering, index = self.parse(request, view)
+        return queryset.filter(**lookups).order_by(*ordering)
+
+    def get_ordering(self, request, queryset, view):
+        lookups, ordering, index = self.parse(request, view)
+        return ordering
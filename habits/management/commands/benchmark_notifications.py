@@ -0,0 +1,110 @@
+import resource
+import statistics
+import time
+
+from django.core.management import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from config.celery import app
+from habits.models import Habit
+from habits.tasks import send_notifications
+from habits.telegram_stub import TelegramStubServer
+from users.models import User
+
+BENCHMARK_PREFIX = 'benchmark_user_'
+
+
+class Command(BaseCommand):
+    """
+    Seed users with due habits and run the notification pipeline end to end against the local Telegram stub.
+
+    The tasks run eagerly in this process, so no worker or broker is needed. The delivery latency of a message is the
+    time from the start of the tick until the stub received it. The pipeline handles every due habit of
+    the database, so run it against a development database only. The benchmark users are deleted afterwards.
+    """
+
+    help = 'Benchmark the notification pipeline against a local Telegram stub.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--habits-per-user', type=int, default=1)
+        parser.add_argument('--latency', type=float, default=0.05, help='Mean stub response time, in seconds.')
+        parser.add_argument('--error-rate', type=float, default=0.0)
+        parser.add_argument('--throttle-rate', type=float, default=0.0)
+        parser.add_argument('--global-rate', type=float, help='Override TELEGRAM_GLOBAL_RATE_LIMIT.')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark users and habits.')
+
+    def handle(self, *args, **options):
+        self.delete_benchmark_users()
+        self.seed(options['users'], options['habits_per_user'])
+
+        stub = TelegramStubServer(latency=options['latency'], jitter=options['latency'] / 5,
+                                  error_rate=options['error_rate'], throttle_rate=options['throttle_rate'])
+        stub.start()
+
+        test_settings = {'TELEGRAM_API_URL': stub.url}
+        if options['global_rate']:
+            test_settings['TELEGRAM_GLOBAL_RATE_LIMIT'] = options['global_rate']
+
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        always_eager = app.conf.task_always_eager
+        app.conf.task_always_eager = True
+        try:
+            with override_settings(**test_settings), connection.execute_wrapper(count_query):
+                started_at = time.monotonic()
+                totals = send_notifications().get()
+                elapsed = time.monotonic() - started_at
+        finally:
+            app.conf.task_always_eager = always_eager
+            stub.shutdown()
+            stub.server_close()
+
+        latencies = sorted(delivered_at - started_at for delivered_at, chat_id, text in stub.delivered)
+        self.report(totals, len(latencies), latencies, elapsed, len(queries))
+
+        if not options['keep']:
+            self.delete_benchmark_users()
+
+    def seed(self, users_count, habits_per_user):
+        """ Create users with habits that are all due now. """
+
+        now = timezone.now()
+        users = User.objects.bulk_create(
+            User(username=f'{BENCHMARK_PREFIX}{i}', telegram_id=f'@{BENCHMARK_PREFIX}{i}', chat_id=str(i),
+                 password='!')
+            for i in range(users_count)
+        )
+        Habit.objects.bulk_create(
+            (
+                Habit(owner=user, action=f'habit {i}', location='home', time=now.time().replace(microsecond=0),
+                      periodicity='daily', days=1, execution_time=60, start_date=now.date())
+                for user in users for i in range(habits_per_user)
+            ),
+            batch_size=5000,
+        )
+        Habit.objects.filter(owner__username__startswith=BENCHMARK_PREFIX).reschedule()
+
+    def delete_benchmark_users(self):
+        User.objects.filter(username__startswith=BENCHMARK_PREFIX).delete()
+
+    def report(self, totals, delivered, latencies, elapsed, queries):
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        self.stdout.write(f"Habits due:          {totals['due']}")
+        self.stdout.write(f"Messages scheduled:  {totals['messages']}")
+        self.stdout.write(f'Messages delivered:  {delivered}')
+        self.stdout.write(f'Elapsed:             {elapsed:.2f} s')
+        self.stdout.write(f'Throughput:          {delivered / elapsed:.1f} messages/s')
+        if latencies:
+            p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+            self.stdout.write(f'Delivery p50:        {statistics.median(latencies) * 1000:.1f} ms')
+            self.stdout.write(f'Delivery p99:        {p99 * 1000:.1f} ms')
+        self.stdout.write(f'DB queries:          {queries}')
+        self.stdout.write(f'Peak RSS:            {peak_rss:.1f} MB')
@@ -0,0 +1,65 @@
+import time
+
+from django.core.management import BaseCommand
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+
+from habits import middleware
+from habits.management.commands.benchmark_serializers import build_habits
+from habits.renderers import FastJSONRenderer, orjson
+from habits.serializers import HabitListSerializer, ValuesSerializer
+
+
+class Command(BaseCommand):
+    """
+    Measure the render CPU and the bytes on the wire of habit list responses.
+
+    For every page size the list is serialized once and rendered with DRF's JSONRenderer and with FastJSONRenderer,
+    then compressed as CompressionMiddleware would. CPU times are per response, averaged over 'repeat' runs.
+    """
+
+    help = 'Benchmark JSON rendering and compression of habit list responses.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[5, 50, 1000, 10000])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        self.stdout.write(f'orjson: {"installed" if orjson else "missing"}, '
+                          f'brotli: {"installed" if middleware.brotli else "missing"}')
+        self.stdout.write(f'{"Rows":>6} {"json CPU":>10} {"orjson CPU":>11} {"Identity":>10} '
+                          f'{"gzip":>10} {"gzip CPU":>10} {"br":>10} {"br CPU":>10}')
+
+        for rows_count in options['rows']:
+            habits = build_habits(rows_count)
+            data = {
+                'next': None,
+                'previous': None,
+                'results': ValuesSerializer(HabitListSerializer()).to_representation(
+                    [{'action': habit.action, 'periodicity': habit.periodicity} for habit in habits]
+                ),
+            }
+
+            json_cpu, content = self.measure(lambda: JSONRenderer().render(data), repeat)
+            fast_cpu, fast_content = self.measure(lambda: FastJSONRenderer().render(data), repeat)
+            gzip_cpu, gzipped = self.measure(lambda: compress_string(fast_content, max_random_bytes=100), repeat)
+            line = (f'{rows_count:>6} {self.ms(json_cpu):>10} {self.ms(fast_cpu):>11} {len(content):>8} B '
+                    f'{len(gzipped):>8} B {self.ms(gzip_cpu):>10}')
+
+            if middleware.brotli is not None:
+                br_cpu, brotli_content = self.measure(
+                    lambda: middleware.brotli.compress(fast_content, quality=middleware.BROTLI_QUALITY), repeat)
+                line += f' {len(brotli_content):>8} B {self.ms(br_cpu):>10}'
+            self.stdout.write(line)
+
+    @staticmethod
+    def ms(seconds):
+        return f'{seconds * 1000:.3f} ms'
+
+    @staticmethod
+    def measure(work, repeat):
+        started_at = time.process_time()
+        for _ in range(repeat):
+            result = work()
+        return (time.process_time() - started_at) / repeat, result
@@ -0,0 +1,74 @@
+import datetime
+import time
+
+from django.core.management import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from habits.models import Habit
+from habits.serializers import HabitListSerializer, HabitSearchSerializer, ValuesSerializer
+
+SERIALIZERS = {
+    'list': HabitListSerializer,
+    'search': HabitSearchSerializer,
+}
+
+
+def build_habits(count):
+    """ Return 'count' unsaved public habits with distinct values. """
+
+    periodicities = ('daily', 'every_other_day', 'weekly')
+    return [
+        Habit(id=i + 1, owner_id=1, action=f'habit {i}', location='home', time=datetime.time(i % 24, i % 60),
+              periodicity=periodicities[i % len(periodicities)], days=1, execution_time=60,
+              start_date=datetime.date(2024, 1, 1), is_public=True)
+        for i in range(count)
+    ]
+
+
+class Command(BaseCommand):
+    """
+    Compare rendering habit lists with the model serializer and with ValuesSerializer.
+
+    The habits and their values() rows are built in memory, so only serialization and JSON rendering are measured
+    and no database is needed. Each size is rendered 'repeat' times by both paths and the best time is reported. The
+    command fails if the two paths do not render the same bytes.
+    """
+
+    help = 'Benchmark the values() serialization of habit lists against the model serializer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--serializer', choices=SERIALIZERS, default='list')
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        serializer_class = SERIALIZERS[options['serializer']]
+        renderer = JSONRenderer()
+
+        self.stdout.write(f'{"Rows":>8} {"Serializer":>12} {"Values":>12} {"Speedup":>8}')
+        for rows_count in options['rows']:
+            habits = build_habits(rows_count)
+            serializer = serializer_class()
+            sources = [field.source for field in serializer._readable_fields]
+            rows = [{source: getattr(habit, source) for source in sources} for habit in habits]
+
+            model_seconds, model_json = self.measure(
+                lambda: renderer.render(serializer_class(habits, many=True).data), options['repeat'])
+            values_seconds, values_json = self.measure(
+                lambda: renderer.render(ValuesSerializer(serializer_class()).to_representation(rows)),
+                options['repeat'])
+            if values_json != model_json:
+                raise CommandError(f'ValuesSerializer rendered different JSON for {rows_count} rows.')
+
+            self.stdout.write(f'{rows_count:>8} {model_seconds * 1000:>9.1f} ms {values_seconds * 1000:>9.1f} ms '
+                              f'{model_seconds / values_seconds:>7.1f}x')
+
+    @staticmethod
+    def measure(render, repeat):
+        best = None
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            result = render()
+            elapsed = time.perf_counter() - started_at
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
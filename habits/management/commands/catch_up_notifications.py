@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from habits.tasks import catch_up_notifications
+
+
+class Command(BaseCommand):
+    """ Realign the habits whose notifications were missed, e.g. right after an outage of the workers. """
+
+    help = 'Notify about or skip missed habit notifications and move the habits to their next fire time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--policy', choices=('notify', 'skip'), default=settings.NOTIFICATION_CATCH_UP_POLICY,
+                            help='Send one consolidated message per user or skip the missed notifications.')
+
+    def handle(self, *args, **options):
+        totals = catch_up_notifications(options['policy'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{totals["due"]} missed habits realigned, {totals["messages"]} messages scheduled.'
+        ))
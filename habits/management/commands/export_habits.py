@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from habits.exports import export_habits
+from habits.models import Habit
+from habits.renderers import CSVRenderer, NDJSONRenderer
+from users.models import User
+
+RENDERERS = {
+    'ndjson': NDJSONRenderer,
+    'csv': CSVRenderer,
+}
+
+
+class Command(BaseCommand):
+    """
+    Export the habits of one user, or of all users for warehouse loads, as NDJSON or CSV.
+
+    The habits are streamed from a server-side cursor to the output file or to stdout, so exports of any size run in
+    constant memory.
+    """
+
+    help = 'Export habits as NDJSON or CSV.'
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--user', help='Username of the user whose habits are exported.')
+        target.add_argument('--all', action='store_true', help='Export the habits of all users.')
+        parser.add_argument('--format', choices=RENDERERS, default='ndjson')
+        parser.add_argument('--output', help='File to write to, stdout by default.')
+        parser.add_argument('--chunk-size', type=int, default=settings.HABIT_EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        habits = Habit.objects.all()
+        if options['user']:
+            try:
+                habits = habits.filter(owner=User.objects.get(username=options['user']))
+            except User.DoesNotExist:
+                raise CommandError(f'User "{options["user"]}" does not exist.')
+
+        chunks = export_habits(habits, RENDERERS[options['format']](), options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending='')
@@ -0,0 +1,12 @@
+from django.core.management import BaseCommand
+
+from habits.metrics import render_prometheus
+
+
+class Command(BaseCommand):
+    """ Print the metrics of the notification pipeline in the Prometheus text format. """
+
+    help = 'Print the notification pipeline metrics.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(render_prometheus(), ending='')
@@ -0,0 +1,19 @@
+from django.core.management import BaseCommand
+
+from habits.models import Habit
+from habits.scheduler import get_timer_wheel
+
+
+class Command(BaseCommand):
+    """ Fill the Redis timer wheel with the 'next_fire_at' of every habit. """
+
+    help = 'Repopulate the Redis timer wheel from the habits table.'
+
+    def handle(self, *args, **options):
+        fire_times = (
+            Habit.objects.filter(next_fire_at__isnull=False)
+            .values_list('pk', 'next_fire_at')
+            .iterator(chunk_size=5000)
+        )
+        total = get_timer_wheel().rebuild(fire_times)
+        self.stdout.write(self.style.SUCCESS(f'The timer wheel holds {total} habits.'))
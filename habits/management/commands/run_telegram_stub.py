@@ -0,0 +1,33 @@
+from django.core.management import BaseCommand
+
+from habits.telegram_stub import TelegramStubServer
+
+
+class Command(BaseCommand):
+    """ Serve a local stub of the Telegram bot API to point TELEGRAM_API_URL at for load tests. """
+
+    help = 'Run a local stub of the Telegram sendMessage endpoint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8090)
+        parser.add_argument('--latency', type=float, default=0.05, help='Mean response time, in seconds.')
+        parser.add_argument('--jitter', type=float, default=0.01, help='Standard deviation of the response time.')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 500.')
+        parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of requests answered with 429.')
+        parser.add_argument('--retry-after', type=int, default=1, help='retry_after sent with 429 responses.')
+
+    def handle(self, *args, **options):
+        server = TelegramStubServer(
+            (options['host'], options['port']),
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            throttle_rate=options['throttle_rate'],
+            retry_after=options['retry_after'],
+        )
+        self.stdout.write(f'Telegram stub listening on {server.url}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.utils import timezone
+
+from habits.scheduler import HabitTimerWheel, get_timer_wheel
+from habits.tasks import send_habit_notifications
+
+
+class Command(BaseCommand):
+    """
+    Pop due habits from the Redis timer wheel and enqueue 'send_habit_notifications' for them.
+
+    Runs instead of the 'send_notifications' beat entry when NOTIFICATION_SCHEDULER is 'timer_wheel'.
+    """
+
+    help = 'Pop due habits from the Redis timer wheel and enqueue their notifications.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Habits enqueued per task.')
+        parser.add_argument('--max-sleep', type=float, default=1.0, help='Longest pause between polls, in seconds.')
+
+    def handle(self, *args, **options):
+        if not HabitTimerWheel.is_enabled():
+            raise CommandError("Set NOTIFICATION_SCHEDULER to 'timer_wheel' to use the timer wheel.")
+
+        timer_wheel = get_timer_wheel()
+        self.stdout.write('Timer wheel loop started.')
+
+        while True:
+            now = timezone.now()
+            habit_ids = timer_wheel.pop_due(now, options['batch_size'])
+            if habit_ids:
+                send_habit_notifications.delay(habit_ids)
+                continue
+
+            next_fire_at = timer_wheel.next_fire_at()
+            pause = options['max_sleep']
+            if next_fire_at is not None:
+                pause = min(max((next_fire_at - now).total_seconds(), 0), pause)
+            time.sleep(pause)
@@ -0,0 +1,140 @@
+from collections import defaultdict
+
+from django.core.cache import cache
+
+METRICS_KEY_PREFIX = 'metrics'
+
+# Histogram sums are kept as integers, in millionths of the observed unit.
+SUM_SCALE = 1_000_000
+
+REGISTRY = []
+_pending = defaultdict(int)
+
+
+class Metric:
+    """
+    A metric of the notification pipeline, kept in the Django cache so that all web and worker processes add up.
+
+    Updates are collected in the process and written to the cache by flush(), so hot paths do not pay a cache round
+    trip per observation. A metric has at most one label, whose values are declared up front.
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, label=None, label_values=()):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.label_values = tuple(label_values) if label else (None,)
+        REGISTRY.append(self)
+
+    def key(self, suffix, label_value=None):
+        return ':'.join(str(part) for part in (METRICS_KEY_PREFIX, self.name, suffix, label_value) if part is not None)
+
+    def labels(self, label_value, extra=None):
+        pairs = []
+        if label_value is not None:
+            pairs.append(f'{self.label}="{label_value}"')
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def keys(self):
+        raise NotImplementedError
+
+    def render(self, values):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """ A monotonically increasing count. """
+
+    kind = 'counter'
+
+    def inc(self, amount=1, label_value=None):
+        _pending[self.key('total', label_value)] += amount
+
+    def keys(self):
+        return [self.key('total', label_value) for label_value in self.label_values]
+
+    def render(self, values):
+        for label_value in self.label_values:
+            yield f'{self.name}{self.labels(label_value)} {values.get(self.key("total", label_value), 0)}'
+
+
+class Histogram(Metric):
+    """ A distribution of observed values over fixed buckets. """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value):
+        for bound in self.buckets:
+            if value <= bound:
+                _pending[self.key(f'bucket:{bound}')] += 1
+                break
+        _pending[self.key('count')] += 1
+        _pending[self.key('sum')] += round(value * SUM_SCALE)
+
+    def keys(self):
+        return [self.key(f'bucket:{bound}') for bound in self.buckets] + [self.key('count'), self.key('sum')]
+
+    def render(self, values):
+        cumulative = 0
+        for bound in self.buckets:
+            cumulative += values.get(self.key(f'bucket:{bound}'), 0)
+            yield f'{self.name}_bucket{{le="{bound}"}} {cumulative}'
+        count = values.get(self.key('count'), 0)
+        yield f'{self.name}_bucket{{le="+Inf"}} {count}'
+        yield f'{self.name}_sum {values.get(self.key("sum"), 0) / SUM_SCALE}'
+        yield f'{self.name}_count {count}'
+
+
+def flush():
+    """ Add the updates collected in this process to the shared metrics. """
+
+    while _pending:
+        key, amount = _pending.popitem()
+        if not cache.add(key, amount, timeout=None):
+            cache.incr(key, amount)
+
+
+def render_prometheus():
+    """ Return all metrics in the Prometheus text exposition format. """
+
+    values = cache.get_many([key for metric in REGISTRY for key in metric.keys()])
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.render(values))
+    return '\n'.join(lines) + '\n'
+
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LAG_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 5000)
+
+FAILURE_REASONS = ('no_chat', 'throttled', 'client_error', 'server_error', 'timeout', 'network')
+
+habits_due = Counter('habits_notification_habits_due_total', 'Habits claimed for a notification.')
+habits_missed = Counter('habits_notification_habits_missed_total', 'Habits whose missed notification was caught up.',
+                        label='policy', label_values=('notify', 'skip'))
+messages_scheduled = Counter('habits_notification_messages_scheduled_total',
+                             'Messages written to the notification outbox.')
+claim_batch_size = Histogram('habits_notification_claim_batch_size', 'Habits per claimed batch.', SIZE_BUCKETS)
+claim_seconds = Histogram('habits_notification_claim_seconds', 'Time to claim a batch of due habits.',
+                          SECONDS_BUCKETS)
+messages_sent = Counter('habits_telegram_messages_sent_total', 'Messages accepted by the Telegram API.')
+send_failures = Counter('habits_telegram_send_failures_total', 'Messages the Telegram API did not accept.',
+                        label='reason', label_values=FAILURE_REASONS)
+send_retries = Counter('habits_telegram_send_retries_total', 'Throttled messages sent again after retry_after.')
+circuit_breaker_opened = Counter('habits_telegram_circuit_breaker_opened_total',
+                                 'Times dispatch was paused because the Telegram API was failing.')
+send_seconds = Histogram('habits_telegram_send_seconds', 'Duration of a sendMessage call.', SECONDS_BUCKETS)
+delivery_lag_seconds = Histogram('habits_notification_delivery_lag_seconds',
+                                 'Time between the scheduled fire time and the delivery of a message.', LAG_BUCKETS)
+messages_dead = Counter('habits_notification_messages_dead_total', 'Messages moved to the dead-letter state.')
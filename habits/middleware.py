@@ -0,0 +1,91 @@
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BROTLI_QUALITY = 5
+
+
+def get_accepted_encodings(header):
+    """ Return the content codings of an Accept-Encoding header with their q-values. """
+
+    encodings = {}
+    for item in header.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        encodings[coding.lower()] = quality
+    return encodings
+
+
+def compress_brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for item in sequence:
+        data = compressor.process(item)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compress responses with brotli or gzip, whichever the client prefers in its Accept-Encoding header.
+
+    Brotli is preferred on equal q-values and is only used when the brotli package is installed. Responses shorter
+    than RESPONSE_COMPRESSION_MIN_SIZE bytes are sent as they are, since compressing them saves less than it costs.
+    Gzip is done by Django's GZipMiddleware.
+    """
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < settings.RESPONSE_COMPRESSION_MIN_SIZE:
+            return response
+        if response.has_header('Content-Encoding'):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = self.get_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding == 'br' and not (response.streaming and response.is_async):
+            return self.compress_brotli(response)
+        if encoding == 'gzip':
+            return super().process_response(request, response)
+        return response
+
+    @staticmethod
+    def get_encoding(header):
+        """ Return the supported content coding the client prefers, or None. """
+
+        accepted = get_accepted_encodings(header)
+        available = ('br', 'gzip') if brotli is not None else ('gzip',)
+        qualities = {coding: accepted.get(coding, accepted.get('*', 0.0)) for coding in available}
+        best = max(available, key=lambda coding: qualities[coding])
+        return best if qualities[best] > 0 else None
+
+    @staticmethod
+    def compress_brotli(response):
+        if response.streaming:
+            response.streaming_content = compress_brotli_sequence(response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            compressed_content = brotli.compress(response.content, quality=BROTLI_QUALITY)
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers['Content-Length'] = str(len(response.content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
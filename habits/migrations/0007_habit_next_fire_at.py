@@ -0,0 +1,29 @@
+# Generated by Django 4.2.6 on 2026-10-18 11:06
+
+from django.db import migrations, models
+
+# Fill 'next_fire_at' for the existing habits in one UPDATE: the habit's time on its next notification date, in UTC.
+POPULATE_NEXT_FIRE_AT_SQL = (
+    'UPDATE "habits" SET "next_fire_at" = '
+    '(COALESCE("last_notification" + "days", "start_date") + "time") AT TIME ZONE \'UTC\''
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0006_alter_habit_action_alter_habit_days_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='next_fire_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Next notification time'),
+        ),
+        migrations.RunSQL(POPULATE_NEXT_FIRE_AT_SQL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(fields=['next_fire_at', 'owner'], name='habits_next_fire_at_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-18 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0009_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='scheduled_for',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Scheduled fire time'),
+        ),
+    ]
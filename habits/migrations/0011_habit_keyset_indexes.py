@@ -0,0 +1,21 @@
+# Generated by Django 4.2.6 on 2026-10-18 11:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0010_notificationoutbox_scheduled_for'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(fields=['owner', 'id'], name='habits_owner_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['id'], name='habits_public_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.6 on 2026-10-18 11:45
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0011_habit_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Updated at'),
+            preserve_default=False,
+        ),
+    ]
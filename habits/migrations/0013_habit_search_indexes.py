@@ -0,0 +1,50 @@
+# Generated by Django 4.2.6 on 2026-10-18 11:36
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+TRIGRAM_INDEXES = (
+    ('habits_action_trgm_idx', 'action'),
+    ('habits_location_trgm_idx', 'location'),
+)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """
+    Install pg_trgm and index the action and location of public habits for trigram similarity.
+
+    The extension is not shipped with every PostgreSQL build. Without it the indexes are skipped and habit search
+    falls back to full-text search only.
+    """
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{name}" ON "habits" USING gin ("{column}" gin_trgm_ops) WHERE "is_public"'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    for name, column in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0012_habit_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='habit',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('action', 'location', config='russian'), condition=models.Q(('is_public', True)), name='habits_search_idx'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.6 on 2026-10-18 12:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0013_habit_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(fields=['owner', 'periodicity', 'id'], name='habits_owner_periodicity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(fields=['owner', 'is_pleasant', 'id'], name='habits_owner_pleasant_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(fields=['owner', 'is_public', 'id'], name='habits_owner_public_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(fields=['owner', 'time', 'id'], name='habits_owner_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['periodicity', 'id'], name='habits_public_periodicity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['is_pleasant', 'id'], name='habits_public_pleasant_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['time', 'id'], name='habits_public_time_idx'),
+        ),
+    ]
@@ -1,11 +1,226 @@
+from collections import defaultdict
+from functools import lru_cache
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from typing import NamedTuple
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
 from django.core.validators import MaxValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest
+from django.utils import timezone
 from rest_framework.serializers import ValidationError
 
 from users.models import User
 
 NULLABLE = {'blank': True, 'null': True}
 
+NOTIFIED_CHUNK_SIZE = 5000
+CLAIM_CHUNK_SIZE = 500
+
+NOTIFICATION_MAX_DELAY = timedelta(days=1)
+
+HABIT_SEARCH_CONFIG = 'russian'
+
+OWNER_TIMEZONE_SQL = '(SELECT "users"."timezone" FROM "users" WHERE "users"."id" = "habits"."owner_id")'
+LOCAL_FIRE_DATE_SQL = f'("habits"."next_fire_at" AT TIME ZONE {OWNER_TIMEZONE_SQL})::date'
+NEXT_FIRE_DATE_SQL = 'COALESCE("habits"."last_notification" + "habits"."days", "habits"."start_date")'
+LOCAL_NOW_DATE_SQL = f'(%s::timestamptz AT TIME ZONE {OWNER_TIMEZONE_SQL})::date'
+# The first date of the habit's cycle, counted from its missed fire date, that is not before the owner's local today.
+ALIGNED_FIRE_DATE_SQL = (
+    f'({LOCAL_FIRE_DATE_SQL} + (({LOCAL_NOW_DATE_SQL} - {LOCAL_FIRE_DATE_SQL} + "habits"."days" - 1) '
+    f'/ "habits"."days") * "habits"."days")'
+)
+
+
+def fire_time_sql(date_sql):
+    """ SQL for the UTC instant of the habit's 'time' on the owner's local date given by 'date_sql'. """
+
+    return f'(({date_sql} + "habits"."time") AT TIME ZONE {OWNER_TIMEZONE_SQL})'
+
+
+def realigned_fire_date_sql():
+    """
+    SQL for the first date of the habit's cycle whose fire time is not before the instant passed as every parameter.
+    """
+
+    return (
+        f'({ALIGNED_FIRE_DATE_SQL} + CASE WHEN {fire_time_sql(ALIGNED_FIRE_DATE_SQL)} < %s '
+        f'THEN "habits"."days" ELSE 0 END)'
+    )
+
+
+def habit_search_vector():
+    """ The full-text search vector over a habit's action and location, the expression of 'habits_search_idx'. """
+
+    return SearchVector('action', 'location', config=HABIT_SEARCH_CONFIG)
+
+
+@lru_cache
+def has_trigram_extension(using):
+    """ Whether the pg_trgm extension is installed in the database 'using'. Checked once per process. """
+
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def make_fire_time(fire_date, fire_time, tz):
+    """
+    Return the UTC instant of the local 'fire_time' on 'fire_date' in the time zone 'tz'.
+
+    Daylight saving time transitions are resolved the way PostgreSQL resolves 'timestamp AT TIME ZONE zone', so the
+    fire times calculated here and by the set-based updates of HabitQuerySet agree: a time skipped by the transition
+    is read with the offset before it, an ambiguous time as its later occurrence.
+    """
+
+    local = datetime.combine(fire_date, fire_time, tzinfo=tz)
+    later = local.replace(fold=1)
+    if later.astimezone(dt_timezone.utc).astimezone(tz).replace(tzinfo=None) == local.replace(tzinfo=None):
+        local = later
+    return local.astimezone(dt_timezone.utc)
+
+
+class DueHabit(NamedTuple):
+    """ The columns of a due habit needed to notify its owner. """
+
+    pk: int
+    owner_id: int
+    chat_id: str
+    action: str
+    location: str
+    time: dt_time
+    next_fire_at: datetime
+
+
+DUE_HABIT_COLUMNS = ('pk', 'owner_id', 'owner__chat_id', 'action', 'location', 'time', 'next_fire_at')
+
+
+class HabitQuerySet(models.QuerySet):
+    """ QuerySet with set-based bulk operations for habits. """
+
+    def due(self, now):
+        """
+        Filter the habits whose notification is due by the end of the minute of 'now' and is not more than
+        NOTIFICATION_MAX_DELAY overdue.
+        """
+
+        window_end = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        return self.filter(next_fire_at__gte=window_end - NOTIFICATION_MAX_DELAY, next_fire_at__lt=window_end)
+
+    def missed(self, now):
+        """
+        Filter the habits whose notification is more than NOTIFICATION_MAX_DELAY overdue at 'now', for example after
+        the workers were down. due() never matches these habits again, so they need to be realigned.
+        """
+
+        window_end = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        return self.filter(next_fire_at__lt=window_end - NOTIFICATION_MAX_DELAY)
+
+    def claim(self, limit, chunk_size=CLAIM_CHUNK_SIZE):
+        """
+        Lock up to 'limit' habits of the queryset for scheduling their notification and return them as DueHabit
+        records.
+
+        The rows are locked with SELECT ... FOR UPDATE SKIP LOCKED, so concurrent workers claim disjoint sets of
+        habits. Only the columns needed for the notification and the owner's chat_id are read, in one joined query
+        that is streamed from a server-side cursor in chunks of 'chunk_size' rows. The habits are claimed by owner,
+        and when the limit cuts through the habits of the last owner the rest of them are claimed too, so the habits
+        of one owner are never split across batches and get one digest. Must be called inside the transaction that
+        advances the claimed habits.
+        """
+
+        def claim_rows(habits, limit=None):
+            rows = habits.select_for_update(skip_locked=True, of=('self',)).values_list(*DUE_HABIT_COLUMNS)
+            return [DueHabit(*row) for row in rows[:limit].iterator(chunk_size=chunk_size)]
+
+        claimed = claim_rows(self.order_by('owner_id', 'next_fire_at'), limit)
+        if claimed and len(claimed) == limit:
+            last_owner_id = claimed[-1].owner_id
+            claimed += claim_rows(
+                self.filter(owner_id=last_owner_id)
+                .exclude(pk__in=[habit.pk for habit in claimed if habit.owner_id == last_owner_id])
+                .order_by('next_fire_at')
+            )
+        return claimed
+
+    def mark_notified(self, habit_ids, chunk_size=NOTIFIED_CHUNK_SIZE):
+        """
+        Record the notification due at 'next_fire_at' for the given habits and move them to their next period.
+
+        'last_notification' becomes the owner's local date of 'next_fire_at' and 'next_fire_at' the habit's time on
+        the local date 'days' later, converted to UTC in the database. The habits are updated in chunks of
+        'chunk_size' ids with one UPDATE per chunk that only touches the notification columns, bypassing Habit.save.
+        Returns the number of updated habits.
+        """
+
+        habit_ids = list(habit_ids)
+        updated = 0
+
+        for start in range(0, len(habit_ids), chunk_size):
+            updated += self.filter(pk__in=habit_ids[start:start + chunk_size]).update(
+                last_notification=RawSQL(LOCAL_FIRE_DATE_SQL, ()),
+                next_fire_at=RawSQL(fire_time_sql(f'({LOCAL_FIRE_DATE_SQL} + "habits"."days")'), ()),
+            )
+        return updated
+
+    def realign(self, habit_ids, now, chunk_size=NOTIFIED_CHUNK_SIZE):
+        """
+        Move the given habits, whose notifications were missed, to the first fire time of their cycle after 'now'.
+
+        The new fire date keeps the habit's phase: it is the missed local fire date plus a whole number of periods.
+        'last_notification' is set one period before it, so reschedule() calculates the same 'next_fire_at'. The
+        habits are updated in chunks of 'chunk_size' ids with one UPDATE per chunk, bypassing Habit.save. Returns the
+        number of updated habits.
+        """
+
+        habit_ids = list(habit_ids)
+        fire_date_sql = realigned_fire_date_sql()
+        last_notification_sql = f'({fire_date_sql} - "habits"."days")'
+        next_fire_at_sql = fire_time_sql(fire_date_sql)
+        updated = 0
+
+        for start in range(0, len(habit_ids), chunk_size):
+            updated += self.filter(pk__in=habit_ids[start:start + chunk_size]).update(
+                last_notification=RawSQL(last_notification_sql, (now,) * last_notification_sql.count('%s')),
+                next_fire_at=RawSQL(next_fire_at_sql, (now,) * next_fire_at_sql.count('%s')),
+            )
+        return updated
+
+    def search(self, text):
+        """
+        Filter the habits whose action or location matches 'text' and order them by relevance.
+
+        'text' is matched with full-text search in the HABIT_SEARCH_CONFIG configuration and, when the pg_trgm
+        extension is installed, by trigram similarity, so misspelled words are found too. The habits are ranked by
+        their full-text rank, then by their best trigram similarity. Both conditions are served by the GIN indexes of
+        public habits.
+        """
+
+        query = SearchQuery(text, config=HABIT_SEARCH_CONFIG, search_type='websearch')
+        condition = Q(search_vector=query)
+        similarity = Value(0.0)
+        if has_trigram_extension(self.db):
+            condition |= Q(action__trigram_similar=text) | Q(location__trigram_similar=text)
+            similarity = Greatest(TrigramSimilarity('action', text), TrigramSimilarity('location', text))
+
+        return (
+            self.annotate(search_vector=habit_search_vector())
+            .filter(condition)
+            .annotate(rank=SearchRank(habit_search_vector(), query), similarity=similarity)
+            .order_by('-rank', '-similarity', 'id')
+        )
+
+    def reschedule(self):
+        """
+        Recalculate 'next_fire_at' of the habits from their schedule and their owner's time zone in one UPDATE.
+        """
+
+        return self.update(next_fire_at=RawSQL(fire_time_sql(NEXT_FIRE_DATE_SQL), ()))
+
 
 class Habit(models.Model):
     """ Represents a habit created by a user. """
@@ -25,13 +240,44 @@ class Habit(models.Model):
     is_public = models.BooleanField(default=False, verbose_name='Public habit')
     start_date = models.DateField(verbose_name='Start date')
     last_notification = models.DateField(null=True, blank=True, verbose_name='Last notification date')
+    next_fire_at = models.DateTimeField(verbose_name='Next notification time', **NULLABLE)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Updated at')
+
+    objects = HabitQuerySet.as_manager()
+
+    # Whether the habit was public when it was loaded or last saved, None if that is not known.
+    was_public = None
 
     def __str__(self):
         return self.action
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        habit = super().from_db(db, field_names, values)
+        if 'is_public' in habit.__dict__:
+            habit.was_public = habit.is_public
+        return habit
+
+    def may_be_in_public_feed(self):
+        """ Whether writing the habit can change the public feed: it is public now or may have been before. """
+
+        return self.is_public or self.was_public is not False
+
     def save(self, *args, **kwargs):
         """Save the habit with adjusted 'days' value based on 'periodicity'. """
 
+        self.set_schedule()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'next_fire_at', 'updated_at'}
+        super().save(*args, **kwargs)
+
+    def set_schedule(self):
+        """
+        Set 'days' from 'periodicity' and 'next_fire_at' from the schedule, as save() does before writing the habit.
+        Habits written with bulk_create() or bulk_update() must be prepared with it.
+        """
+
         if self.periodicity == 'daily':
             self.days = 1
         elif self.periodicity == 'every_other_day':
@@ -46,7 +292,25 @@ class Habit(models.Model):
             self.days = 6
         elif self.periodicity == 'weekly':
             self.days = 7
-        super().save(*args, **kwargs)
+
+        self.next_fire_at = self.get_next_fire_at()
+
+    def get_next_fire_at(self):
+        """
+        Calculate the moment the next notification for the habit is due.
+
+        The first notification is sent on 'start_date', every following one 'days' after the last notification,
+        always at the habit's 'time' in the owner's time zone. The result is in UTC.
+        """
+
+        if self.last_notification is None:
+            fire_date = self._meta.get_field('start_date').to_python(self.start_date)
+        else:
+            fire_date = self._meta.get_field('last_notification').to_python(self.last_notification)
+            fire_date += timedelta(days=self.days)
+        fire_time = self._meta.get_field('time').to_python(self.time)
+        owner_timezone = self.owner._meta.get_field('timezone').to_python(self.owner.timezone)
+        return make_fire_time(fire_date, fire_time, owner_timezone)
 
     def clean(self):
         """Checks if the habit references itself, which is not allowed. """
@@ -59,3 +323,116 @@ class Habit(models.Model):
         verbose_name = 'habit'
         verbose_name_plural = 'habits'
         db_table = 'habits'
+        indexes = [
+            models.Index(fields=('next_fire_at', 'owner'), name='habits_next_fire_at_idx'),
+            models.Index(fields=('owner', 'id'), name='habits_owner_id_idx'),
+            models.Index(fields=('owner', 'periodicity', 'id'), name='habits_owner_periodicity_idx'),
+            models.Index(fields=('owner', 'is_pleasant', 'id'), name='habits_owner_pleasant_idx'),
+            models.Index(fields=('owner', 'is_public', 'id'), name='habits_owner_public_idx'),
+            models.Index(fields=('owner', 'time', 'id'), name='habits_owner_time_idx'),
+            models.Index(fields=('id',), name='habits_public_idx', condition=Q(is_public=True)),
+            models.Index(fields=('periodicity', 'id'), name='habits_public_periodicity_idx',
+                         condition=Q(is_public=True)),
+            models.Index(fields=('is_pleasant', 'id'), name='habits_public_pleasant_idx', condition=Q(is_public=True)),
+            models.Index(fields=('time', 'id'), name='habits_public_time_idx', condition=Q(is_public=True)),
+            GinIndex(habit_search_vector(), name='habits_search_idx', condition=Q(is_public=True)),
+        ]
+
+
+class NotificationOutboxQuerySet(models.QuerySet):
+    """ QuerySet with the claiming and bookkeeping operations of the notification outbox. """
+
+    def claim(self, now, limit, lease):
+        """
+        Lease up to 'limit' pending messages that are ready to be sent at 'now' and return them.
+
+        The rows are locked with SELECT ... FOR UPDATE SKIP LOCKED, so concurrent drainers claim disjoint sets of
+        messages, and their 'next_attempt_at' is moved to 'now' + 'lease'. A message whose drainer died is therefore
+        sent again once the lease expires, so a drainer must not send the messages after their lease: it puts back
+        the messages it could not send in time with postpone().
+        """
+
+        with transaction.atomic():
+            messages = list(
+                self.filter(status=NotificationOutbox.PENDING, next_attempt_at__lte=now)
+                .order_by('next_attempt_at')
+                .select_for_update(skip_locked=True)
+                .only('id', 'chat_id', 'text', 'attempts', 'scheduled_for')[:limit]
+            )
+            self.filter(pk__in=[message.pk for message in messages]).update(next_attempt_at=now + lease)
+        return messages
+
+    def mark_sent(self, message_ids, now):
+        """ Mark the given messages as delivered. """
+
+        return self.filter(pk__in=list(message_ids)).update(status=NotificationOutbox.SENT, sent_at=now)
+
+    def mark_failed(self, failures, now, max_attempts, backoff):
+        """
+        Schedule a retry for the given failed messages or move them to the dead-letter state.
+
+        'failures' is an iterable of (message, error, retry_after) triples. A message is retried after 'backoff'
+        doubled for every previous attempt, or after the 'retry_after' seconds the Telegram API asked for if that is
+        longer, and is dead once it has been tried 'max_attempts' times. The messages are updated with one UPDATE per
+        distinct (attempts, error, retry_after).
+        """
+
+        groups = defaultdict(list)
+        for message, error, retry_after in failures:
+            groups[(message.attempts, error, retry_after)].append(message.pk)
+
+        dead = 0
+        for (attempts, error, retry_after), message_ids in groups.items():
+            attempts += 1
+            if attempts >= max_attempts:
+                fields = {'status': NotificationOutbox.DEAD}
+                dead += len(message_ids)
+            else:
+                delay = backoff * 2 ** (attempts - 1)
+                if retry_after is not None:
+                    delay = max(delay, timedelta(seconds=retry_after))
+                fields = {'next_attempt_at': now + delay}
+            self.filter(pk__in=message_ids).update(attempts=attempts, last_error=error[:255], **fields)
+        return dead
+
+    def postpone(self, message_ids, until):
+        """ Put the given messages back without counting an attempt, to be sent again at 'until'. """
+
+        return self.filter(pk__in=list(message_ids)).update(next_attempt_at=until)
+
+
+class NotificationOutbox(models.Model):
+    """ A Telegram message scheduled for a user, kept until it is delivered or given up on. """
+
+    PENDING = 'pending'
+    SENT = 'sent'
+    DEAD = 'dead'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (DEAD, 'Dead'),
+    )
+
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Owner', related_name='notifications')
+    chat_id = models.CharField(max_length=255, verbose_name='Telegram chat id')
+    text = models.TextField(verbose_name='Text')
+    scheduled_for = models.DateTimeField(verbose_name='Scheduled fire time', **NULLABLE)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, verbose_name='Status')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Attempts')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Next attempt time')
+    last_error = models.CharField(max_length=255, verbose_name='Last error', **NULLABLE)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Created at')
+    sent_at = models.DateTimeField(verbose_name='Sent at', **NULLABLE)
+
+    objects = NotificationOutboxQuerySet.as_manager()
+
+    def __str__(self):
+        return f'{self.chat_id}: {self.text}'
+
+    class Meta:
+        verbose_name = 'notification'
+        verbose_name_plural = 'notifications'
+        db_table = 'notification_outbox'
+        indexes = [
+            models.Index(fields=('next_attempt_at',), name='outbox_pending_idx', condition=Q(status='pending')),
+        ]
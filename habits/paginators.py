@@ -1,9 +1,130 @@
+from collections import OrderedDict
+
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from habits.feeds import PublicHabitFeed
 
 
-class HabitPaginator(pagination.PageNumberPagination):
-    """ Custom paginator for paginating Habit objects. """
+class HabitPaginator(pagination.CursorPagination):
+    """
+    Custom paginator for paginating Habit objects.
+
+    Pages are addressed by an opaque cursor over the habit's id instead of a page number, so every page is one index
+    range scan with no COUNT(*) and no OFFSET, however deep it is.
+    """
 
     page_size = 5
     page_size_query_param = 'page_size'
-    max_page_size = 50
\ No newline at end of file
+    max_page_size = 50
+    ordering = 'id'
+
+
+class PublicHabitPaginator(HabitPaginator):
+    """
+    Paginator for the public habits feed that cuts its pages out of the cached PublicHabitFeed.
+
+    Links and cursors are the same as those of HabitPaginator, but a page is read from the cache and only leaves out
+    the requesting user's own habits, so most requests do not touch the database.
+    """
+
+    from_feed = False
+    next_cursor = None
+    previous_cursor = None
+
+    def paginate_feed(self, request):
+        """ Return the serialized public habits of the page requested by 'request'. """
+
+        self.from_feed = True
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor.reverse
+        try:
+            position = int(cursor.position) if cursor is not None and cursor.position is not None else None
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+        rows, has_more = PublicHabitFeed().page(position, reverse, self.page_size, request.user.pk)
+        if reverse:
+            rows.reverse()
+        first_id = rows[0][0] if rows else None
+        last_id = rows[-1][0] if rows else None
+
+        if reverse:
+            if has_more:
+                self.previous_cursor = pagination.Cursor(offset=0, reverse=True, position=first_id)
+            self.next_cursor = pagination.Cursor(offset=0, reverse=False,
+                                                 position=position - 1 if last_id is None else last_id)
+        else:
+            if has_more:
+                self.next_cursor = pagination.Cursor(offset=0, reverse=False, position=last_id)
+            if position is not None:
+                self.previous_cursor = pagination.Cursor(offset=0, reverse=True,
+                                                         position=position + 1 if first_id is None else first_id)
+
+        return [data for habit_id, owner_id, data in rows]
+
+    def get_next_link(self):
+        if not self.from_feed:
+            return super().get_next_link()
+        return self.encode_cursor(self.next_cursor) if self.next_cursor else None
+
+    def get_previous_link(self):
+        if not self.from_feed:
+            return super().get_previous_link()
+        return self.encode_cursor(self.previous_cursor) if self.previous_cursor else None
+
+
+class HabitSearchPaginator(pagination.PageNumberPagination):
+    """
+    Paginator for ranked habit search results.
+
+    Results ordered by relevance cannot be paged with a cursor, so pages are numbered, but no COUNT(*) is run: one
+    extra row is read to tell whether there is a next page, and pages deeper than 'max_page' are not served.
+    """
+
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+    max_page = 20
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        page_number = request.query_params.get(self.page_query_param, 1)
+        try:
+            self.number = int(page_number)
+        except ValueError:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message='Not an integer'))
+        if not 1 <= self.number <= self.max_page:
+            raise NotFound(self.invalid_page_message.format(page_number=self.number, message='Out of range'))
+
+        offset = (self.number - 1) * page_size
+        results = list(queryset[offset:offset + page_size + 1])
+        self.has_next = len(results) > page_size
+        return results[:page_size]
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_next_link(self):
+        if not self.has_next or self.number >= self.max_page:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.page_query_param, self.number + 1)
+
+    def get_previous_link(self):
+        if self.number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.number - 1)
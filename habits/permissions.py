@@ -5,4 +5,11 @@ class IsOwner(BasePermission):
     """ Custom permission class to check if a user is the owner of an object. """
 
     def has_object_permission(self, request, view, obj):
-        return request.user == obj.owner
\ No newline at end of file
+        return request.user == obj.owner
+
+
+class IsOwnerOrPublic(BasePermission):
+    """ Custom permission class to check if an object is public or the user is its owner. """
+
+    def has_object_permission(self, request, view, obj):
+        return obj.is_public or request.user.pk == obj.owner_id
@@ -0,0 +1,96 @@
+import csv
+import io
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON renderer that encodes with orjson when it is installed.
+
+    It falls back to DRF's JSONRenderer when orjson is missing, for indented or non-compact output and for data orjson
+    cannot encode, such as integers wider than 64 bits. Values orjson passes on, such as datetimes, decimals and lazy
+    translations, are encoded by DRF's JSONEncoder. The output is the same as that of JSONRenderer except for floats:
+    orjson writes 1e20 where the json module writes 1e+20, and renders NaN and infinities as null where JSONRenderer
+    raises a ValueError. The habit API does not render floats.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact \
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default,
+                               option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escape the line and paragraph separators as JSONRenderer does, so that the output is valid JavaScript.
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class FastJSONParser(JSONParser):
+    """ JSON parser that decodes UTF-8 request bodies with orjson when it is installed, or with DRF's JSONParser. """
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Renderer of a list of objects as newline-delimited JSON, one object per line.
+
+    Streamed exports render the header and the rows of every chunk with render_header() and render_rows().
+    """
+
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        return self.render_header(list(rows[0]) if rows else []) + self.render_rows(rows)
+
+    def render_header(self, field_names):
+        return b''
+
+    def render_rows(self, rows):
+        json_renderer = FastJSONRenderer()
+        return b''.join(json_renderer.render(row) + b'\n' for row in rows)
+
+
+class CSVRenderer(NDJSONRenderer):
+    """ Renderer of a list of objects as CSV with a header row of their field names. """
+
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def render_header(self, field_names):
+        return self.write_rows([field_names])
+
+    def render_rows(self, rows):
+        return self.write_rows(row.values() for row in rows)
+
+    @staticmethod
+    def write_rows(rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode()
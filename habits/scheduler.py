@@ -0,0 +1,113 @@
+from datetime import datetime, timezone as dt_timezone
+
+import redis
+from django.conf import settings
+
+TIMER_WHEEL_KEY = 'habits:timer_wheel'
+REBUILD_CHUNK_SIZE = 5000
+
+POP_DUE_SCRIPT = """
+local habit_ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #habit_ids > 0 then
+    redis.call('ZREM', KEYS[1], unpack(habit_ids))
+end
+return habit_ids
+"""
+
+
+class HabitTimerWheel:
+    """
+    Keeps the next fire time of every habit in a Redis sorted set, scored by the UTC timestamp of 'next_fire_at'.
+
+    The due habits are popped atomically by a Lua script, so several 'run_timer_wheel' loops can share one wheel
+    without popping the same habit twice.
+    """
+
+    def __init__(self, client=None, key=TIMER_WHEEL_KEY):
+        self.client = client or redis.Redis.from_url(settings.NOTIFICATION_TIMER_WHEEL_URL)
+        self.key = key
+        self.pop_due_script = self.client.register_script(POP_DUE_SCRIPT)
+
+    @staticmethod
+    def is_enabled():
+        return settings.NOTIFICATION_SCHEDULER == 'timer_wheel'
+
+    def add(self, fire_times):
+        """
+        Put habits on the wheel. 'fire_times' is an iterable of (habit_id, next_fire_at) pairs, habits without a
+        'next_fire_at' are taken off the wheel.
+        """
+
+        scores = {}
+        removed = []
+        for habit_id, next_fire_at in fire_times:
+            if next_fire_at is None:
+                removed.append(habit_id)
+            else:
+                scores[habit_id] = next_fire_at.timestamp()
+
+        pipeline = self.client.pipeline(transaction=False)
+        if scores:
+            pipeline.zadd(self.key, scores)
+        if removed:
+            pipeline.zrem(self.key, *removed)
+        pipeline.execute()
+
+    def remove(self, habit_ids):
+        """ Take habits off the wheel. """
+
+        habit_ids = list(habit_ids)
+        if habit_ids:
+            self.client.zrem(self.key, *habit_ids)
+
+    def pop_due(self, now, limit):
+        """ Take up to 'limit' habits due at 'now' off the wheel and return their ids. """
+
+        return [int(habit_id) for habit_id in self.pop_due_script(keys=[self.key], args=[now.timestamp(), limit])]
+
+    def next_fire_at(self):
+        """ Return the earliest fire time on the wheel, or None if the wheel is empty. """
+
+        first = self.client.zrange(self.key, 0, 0, withscores=True)
+        if not first:
+            return None
+        return datetime.fromtimestamp(first[0][1], dt_timezone.utc)
+
+    def rebuild(self, fire_times, chunk_size=REBUILD_CHUNK_SIZE):
+        """
+        Replace the contents of the wheel with 'fire_times', an iterable of (habit_id, next_fire_at) pairs.
+
+        The new wheel is filled under a temporary key and swapped in with RENAME, so the loop never sees a partially
+        filled wheel. Returns the number of habits on the wheel.
+        """
+
+        rebuild_key = f'{self.key}:rebuild'
+        self.client.delete(rebuild_key)
+
+        total = 0
+        scores = {}
+        for habit_id, next_fire_at in fire_times:
+            scores[habit_id] = next_fire_at.timestamp()
+            if len(scores) >= chunk_size:
+                total += self.client.zadd(rebuild_key, scores)
+                scores = {}
+        if scores:
+            total += self.client.zadd(rebuild_key, scores)
+
+        if total:
+            self.client.rename(rebuild_key, self.key)
+        else:
+            self.client.delete(self.key)
+        return total
+
+
+_timer_wheel = None
+
+
+def get_timer_wheel():
+    """ Return the HabitTimerWheel shared by the process. """
+
+    global _timer_wheel
+    if _timer_wheel is None:
+        _timer_wheel = HabitTimerWheel()
+    return _timer_wheel
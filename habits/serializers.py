@@ -1,4 +1,10 @@
-from rest_framework.serializers import ModelSerializer, ValidationError
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils import timezone
+from rest_framework import fields, relations
+from rest_framework.serializers import ListSerializer, ModelSerializer, Serializer, ValidationError
 
 from habits.models import Habit
 
@@ -6,14 +12,214 @@ from habits.models import Habit
 PERIODICITY_VALID_VALUES = ('daily', 'every_other_day', 'every_third_day',
                             'every_fourth_day', 'every_fifth_day', 'every_sixth_day', 'weekly')
 
+SERVICE_FIELDS = ('id', 'owner', 'days', 'last_notification', 'next_fire_at', 'updated_at')
+PRIVATE_FIELDS = ('reward', 'related_habit', 'start_date')
+
+
+def get_requested_fields(request, available):
+    """
+    Return the field names requested with the comma-separated 'fields' query parameter, or None if it is missing.
+
+    Names that are not in 'available' are rejected.
+    """
+
+    value = request.query_params.get('fields')
+    if value is None:
+        return None
+
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if not names or unknown:
+        raise ValidationError({'fields': f'Valid fields are: {", ".join(available)}'})
+    return names
+
+
+class SparseFieldsMixin:
+    """ Serializer mixin that limits the fields to those requested with the 'fields' query parameter. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+
+        requested = get_requested_fields(request, self.get_available_fields())
+        if requested is not None:
+            for field_name in list(self.fields):
+                if field_name not in requested:
+                    self.fields.pop(field_name)
+
+    def get_available_fields(self):
+        return list(self.fields)
+
+
+class ValuesSerializer:
+    """
+    Fast read-only serializer for rows read with QuerySet.values().
+
+    It produces the same representation as 'serializer' would for the model instances of the rows, without building
+    an instance and walking the serializer fields for each of them. The fields are looked up once: those whose
+    representation of a database value is the value itself (char, integer and boolean fields, and primary keys of
+    related objects) are copied as is, and the rest are converted with their own to_representation(). The rows must
+    contain the 'source' of every field of 'serializer'.
+    """
+
+    PLAIN_FIELDS = (fields.CharField, fields.IntegerField, fields.BooleanField)
+
+    def __init__(self, serializer):
+        readable_fields = list(serializer._readable_fields)
+        self.names = tuple(field.field_name for field in readable_fields)
+        self.sources = tuple(field.source for field in readable_fields)
+        self.converters = tuple(
+            (index, field.to_representation) for index, field in enumerate(readable_fields)
+            if not self.is_plain(field)
+        )
+
+    @classmethod
+    def is_plain(cls, field):
+        if isinstance(field, relations.PrimaryKeyRelatedField):
+            return field.pk_field is None
+        return type(field) in cls.PLAIN_FIELDS
+
+    def to_representation(self, rows):
+        names = self.names
+        converters = self.converters
+        if len(self.sources) == 1:
+            source = self.sources[0]
+
+            def get_values(row):
+                return (row[source],)
+        else:
+            get_values = itemgetter(*self.sources)
+
+        if not converters:
+            return [dict(zip(names, get_values(row))) for row in rows]
+
+        data = []
+        for row in rows:
+            values = list(get_values(row))
+            for index, convert in converters:
+                if values[index] is not None:
+                    values[index] = convert(values[index])
+            data.append(dict(zip(names, values)))
+        return data
+
+
+class PrefetchedPrimaryKeyRelatedField(relations.PrimaryKeyRelatedField):
+    """
+    Primary key related field that can look its objects up in a dict loaded by prefetch() with one query, instead of
+    running a query for every value it validates.
+    """
+
+    prefetched = None
+
+    def prefetch(self, values):
+        """ Load the objects of all the primary keys among 'values'. """
+
+        pks = set()
+        for value in values:
+            try:
+                pks.add(self.to_pk(value))
+            except (TypeError, ValueError, DjangoValidationError):
+                pass
+        self.prefetched = self.get_queryset().in_bulk(pks)
+
+    def to_pk(self, value):
+        if isinstance(value, bool):
+            raise TypeError
+        return self.get_queryset().model._meta.pk.to_python(value)
+
+    def to_internal_value(self, data):
+        if self.prefetched is None or self.pk_field is not None:
+            return super().to_internal_value(data)
+        try:
+            pk = self.to_pk(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in self.prefetched:
+            self.fail('does_not_exist', pk_value=data)
+        return self.prefetched[pk]
+
+
+class BatchInstanceField(PrefetchedPrimaryKeyRelatedField):
+    """
+    Field for the primary key of one of the habits in the 'instance' queryset of a batch serializer, required even in
+    partial updates.
+    """
+
+    def get_queryset(self):
+        return self.root.instance
+
+    def validate_empty_values(self, data):
+        # The id is required in partial updates too.
+        if data is fields.empty:
+            self.fail('required')
+        return super().validate_empty_values(data)
+
+
+class HabitBatchListSerializer(ListSerializer):
+    """
+    ListSerializer for batches of habits, created with one bulk_create() and updated with one bulk_update().
+
+    The habits referenced by the items of a batch are loaded with one query per field before the items are
+    validated. A batch holds at most HABIT_BATCH_MAX_SIZE items.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('allow_empty', False)
+        kwargs.setdefault('max_length', settings.HABIT_BATCH_MAX_SIZE)
+        super().__init__(*args, **kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, list) and len(data) <= self.max_length:
+            for field in self.child.fields.values():
+                if isinstance(field, PrefetchedPrimaryKeyRelatedField) and not field.read_only:
+                    field.prefetch(item.get(field.field_name) for item in data if isinstance(item, dict))
+        return super().to_internal_value(data)
+
+    def create(self, validated_data):
+        owner = self.context['request'].user
+        habits = [Habit(owner=owner, **attrs) for attrs in validated_data]
+        for habit in habits:
+            habit.set_schedule()
+        return Habit.objects.bulk_create(habits)
+
+    def update(self, instance, validated_data):
+        """
+        Apply every item to the habit of its 'id', as HabitCreateUpdateSerializer.update() does, and write them all
+        with one bulk_update(). Return the habit of every item.
+        """
+
+        now = timezone.now()
+        habits = []
+        update_fields = {'days', 'next_fire_at', 'updated_at'}
+        for attrs in validated_data:
+            habit = attrs.pop('id')
+            start_date = attrs.get('start_date')
+            if start_date is not None and start_date != habit.start_date:
+                habit.last_notification = None
+                update_fields.add('last_notification')
+            for attr, value in attrs.items():
+                setattr(habit, attr, value)
+            update_fields.update(attrs)
+            habit.set_schedule()
+            habit.updated_at = now
+            habits.append(habit)
+
+        Habit.objects.bulk_update(list({habit.pk: habit for habit in habits}.values()), update_fields)
+        return habits
+
 
 class HabitCreateUpdateSerializer(ModelSerializer):
     """ Serializer for creating and updating Habit objects. """
 
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+
     class Meta:
         model = Habit
         fields = ('action', 'location', 'time', 'is_pleasant', 'periodicity', 'related_habit', 'reward',
                   'execution_time', 'is_public', 'start_date')
+        list_serializer_class = HabitBatchListSerializer
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -32,6 +238,7 @@ class HabitCreateUpdateSerializer(ModelSerializer):
         if value not in PERIODICITY_VALID_VALUES:
             raise ValidationError(f"Invalid value for 'periodicity'. "
                                   f"Valid values are: {', '.join(PERIODICITY_VALID_VALUES)}")
+        return value
 
     def validate(self, attrs):
         """ Validate the serializer data. """
@@ -54,7 +261,7 @@ class HabitCreateUpdateSerializer(ModelSerializer):
 
         if value is None:
             raise ValidationError("Error: Related habit is None.")
-        elif value.owner != self.context['request'].user:
+        elif value.owner_id != self.context['request'].user.pk:
             raise ValidationError('Error: Only your own habits can be related to this habit.')
         elif not value.is_pleasant:
             raise ValidationError('Error: Only pleasant habits can be related to this habit.')
@@ -68,8 +275,48 @@ class HabitCreateUpdateSerializer(ModelSerializer):
         habit = Habit.objects.create(**validated_data)
         return habit
 
+    def update(self, instance, validated_data):
+        """
+        Update a Habit object.
+
+        Moving the start date restarts the notification schedule, so 'next_fire_at' is recalculated from the new
+        start date instead of the last notification.
+        """
+
+        start_date = validated_data.get('start_date')
+        if start_date is not None and start_date != instance.start_date:
+            instance.last_notification = None
+        return super().update(instance, validated_data)
+
+
+class HabitBatchUpdateSerializer(HabitCreateUpdateSerializer):
+    """ Serializer for the items of a batch update: the 'id' of the habit to change and the fields to change. """
+
+    id = BatchInstanceField()
+
+    class Meta(HabitCreateUpdateSerializer.Meta):
+        fields = ('id',) + HabitCreateUpdateSerializer.Meta.fields
+
+
+class HabitBatchDeleteSerializer(Serializer):
+    """ Serializer for the items of a batch delete, each the 'id' of a habit to delete. """
+
+    id = BatchInstanceField()
+
+    class Meta:
+        list_serializer_class = HabitBatchListSerializer
+
 
-class HabitListSerializer(ModelSerializer):
+class HabitExportSerializer(ModelSerializer):
+    """ Serializer for exported habits. """
+
+    class Meta:
+        model = Habit
+        fields = ('id', 'owner', 'action', 'location', 'time', 'is_pleasant', 'related_habit', 'periodicity', 'reward',
+                  'execution_time', 'is_public', 'start_date', 'last_notification', 'updated_at')
+
+
+class HabitListSerializer(SparseFieldsMixin, ModelSerializer):
     """ Serializer for listing Habit objects. """
 
     class Meta:
@@ -77,33 +324,34 @@ class HabitListSerializer(ModelSerializer):
         fields = ('action', 'periodicity')
 
 
-class HabitDetailSerializer(ModelSerializer):
+class HabitSearchSerializer(SparseFieldsMixin, ModelSerializer):
+    """ Serializer for habit search results. """
+
+    class Meta:
+        model = Habit
+        fields = ('id', 'action', 'location', 'periodicity')
+
+
+class HabitDetailSerializer(SparseFieldsMixin, ModelSerializer):
     """ Serializer for displaying detailed information about a Habit."""
 
     class Meta:
         model = Habit
         fields = '__all__'
 
-    def to_representation(self, instance):
-
+    def __init__(self, *args, **kwargs):
         """
-        This method customizes the representation of the Habit object by excluding specific fields based on
-        whether the requesting user is the owner.
+        Leave out the service fields, and the private ones unless the requesting user owns the habit, so that
+        excluded fields are never serialized.
         """
 
-        user = self.context.get('request').user
-        data = super().to_representation(instance)
-        excluded_fields = ()
-
-        if instance.owner == user:
-            excluded_fields = ('id', 'owner', 'days', 'last_notification')
-
-        if instance.owner != user:
-            excluded_fields = ('id', 'owner', 'days', 'last_notification', 'reward', 'related_habit', 'start_date')
+        super().__init__(*args, **kwargs)
+        excluded_fields = SERVICE_FIELDS
+        if self.instance is not None and self.instance.owner_id != self.context['request'].user.pk:
+            excluded_fields = SERVICE_FIELDS + PRIVATE_FIELDS
 
         for field in excluded_fields:
-            data.pop(field, None)
-
-        return data
-
+            self.fields.pop(field, None)
 
+    def get_available_fields(self):
+        return [field_name for field_name in self.fields if field_name not in SERVICE_FIELDS]
@@ -1,31 +1,359 @@
-import requests
+import asyncio
+import logging
 import os
+import time
+from collections import defaultdict
+from typing import NamedTuple
+
+import httpx
+from django.conf import settings
+from django.core.cache import cache
 from dotenv import load_dotenv
 
+from habits import metrics
+
 
 load_dotenv()
 
 TG_ACCESS_TOKEN = os.getenv('TG_ACCESS_TOKEN')
 METHOD_NAME = 'sendMessage'
 
+logger = logging.getLogger(__name__)
+
 
-def telegram_bot(chat_id, text):
+def render_notifications(habits):
     """
-    Send a message via a Telegram bot.
-    This function sends a text message to a specific Telegram chat using a Telegram bot API.
+    Build the Telegram messages for the given DueHabit records, one message per chat.
+
+    A chat with a single due habit gets the habit's reminder, a chat with several due habits gets one digest listing
+    all of them. The key of every message is the tuple of ids of the habits it covers.
     """
 
-    api_url = f'https://api.telegram.org/bot{TG_ACCESS_TOKEN}/{METHOD_NAME}'
+    messages = []
+    for chat_id, chat_habits in group_by_chat(habits).items():
+        if len(chat_habits) == 1:
+            habit = chat_habits[0]
+            text = f'Я буду {habit.action} в {habit.location} в {habit.time}'
+        else:
+            text = render_digest('Я буду:', chat_habits)
+        messages.append(TelegramMessage(tuple(habit.pk for habit in chat_habits), chat_id, text))
+    return messages
 
-    data = {
-        'chat_id': chat_id,
-        'text': text
-    }
 
-    try:
-        response = requests.post(url=api_url, params=data)
-        response.raise_for_status()
-        return response
-    except requests.exceptions.RequestException as e:
-        print(f'Error while sending a message via Telegram: {e}')
+def render_catch_up_notifications(habits):
+    """
+    Build one consolidated Telegram message per chat for the given DueHabit records whose notifications were missed.
+    """
+
+    return [
+        TelegramMessage(tuple(habit.pk for habit in chat_habits), chat_id,
+                        render_digest('Пропущенные напоминания:', chat_habits))
+        for chat_id, chat_habits in group_by_chat(habits).items()
+    ]
+
+
+def group_by_chat(habits):
+    """ Group the given DueHabit records by the chat of their owner. """
+
+    by_chat = defaultdict(list)
+    for habit in habits:
+        by_chat[habit.chat_id].append(habit)
+    return by_chat
+
+
+def render_digest(title, habits):
+    """ Render a message listing the given DueHabit records under 'title', ordered by their time. """
+
+    habits = sorted(habits, key=lambda habit: (habit.time, habit.pk))
+    lines = (f'- {habit.action} в {habit.location} в {habit.time}' for habit in habits)
+    return '\n'.join((title, *lines))
+
+
+class TelegramMessage(NamedTuple):
+    """ A message to be sent by the TelegramDispatcher. 'key' is returned back in the matching SendResult. """
+
+    key: object
+    chat_id: str
+    text: str
+
+
+class SendResult(NamedTuple):
+    """
+    The outcome of sending a single TelegramMessage.
+
+    'retry_after' is the number of seconds the Telegram API asked to wait before the message is sent again, and
+    'attempted' is False when the message was held back because the circuit breaker was open or the batch ran out of
+    time.
+    """
+
+    key: object
+    ok: bool
+    status_code: int = None
+    error: str = None
+    retry_after: float = None
+    attempted: bool = True
+
+
+class TokenBucket:
+    """
+    A token bucket that refills at 'rate' tokens per second and holds up to 'capacity' of them.
+
+    It is implemented as a virtual scheduling clock: every acquisition reserves the next free slot, so waiting
+    coroutines are served in order without polling. The bucket can be emptied for a number of seconds with block(),
+    and its rate can be changed while it is in use.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.capacity = capacity
+        self.interval = 0
+        self.next_slot = 0
+        self.lock = asyncio.Lock()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        self.interval = 1 / rate if rate else 0
+
+    def block(self, seconds):
+        """ Hold back all acquisitions for 'seconds' from now. """
+
+        self.next_slot = max(self.next_slot, time.monotonic() + seconds + (self.capacity - 1) * self.interval)
+
+    async def acquire(self, deadline=None):
+        """
+        Wait for a token and return True, or return False at once without taking one if no token is free before the
+        time.monotonic() 'deadline'.
+        """
+
+        async with self.lock:
+            now = time.monotonic()
+            burst = (self.capacity - 1) * self.interval
+            wait = self.next_slot - burst - now
+            if deadline is not None and now + wait > deadline:
+                return False
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return True
+
+
+class SendController:
+    """
+    Decides how fast the TelegramDispatcher may send, based on how the Telegram API answers.
+
+    All messages share a global TokenBucket whose rate adapts to throttling: every accepted message raises it by
+    'rate_increase' up to 'max_rate', and a 429 halves it, at most once per second, down to 'min_rate'. The learned
+    rate is kept in the Django cache, so the next batch starts from it. After 'breaker_threshold' consecutive server
+    errors or network failures the circuit breaker opens for 'breaker_recovery' seconds, during which no process
+    sends anything.
+    """
 
+    RATE_KEY = 'telegram:send_rate'
+    BREAKER_KEY = 'telegram:circuit_open_until'
+
+    def __init__(self, max_rate, min_rate, rate_increase, breaker_threshold, breaker_recovery):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.rate_increase = rate_increase
+        self.breaker_threshold = breaker_threshold
+        self.breaker_recovery = breaker_recovery
+
+        self.rate = min(max(cache.get(self.RATE_KEY, max_rate), self.min_rate), max_rate)
+        self.bucket = TokenBucket(self.rate)
+        self.decreased_at = 0
+        self.failures = 0
+        self.open_until = self.get_open_until()
+
+    @classmethod
+    def get_open_until(cls):
+        """ Return the wall clock time until which the circuit breaker is open, or 0. """
+
+        return cache.get(cls.BREAKER_KEY, 0)
+
+    @classmethod
+    def is_paused(cls):
+        return time.time() < cls.get_open_until()
+
+    def is_open(self):
+        return time.time() < self.open_until
+
+    def record(self, result):
+        """ Adapt the send rate and the circuit breaker to the outcome of a request. """
+
+        if result.ok:
+            self.failures = 0
+            self.set_rate(self.rate + self.rate_increase)
+        elif result.status_code == 429:
+            now = time.monotonic()
+            if now - self.decreased_at >= 1:
+                self.decreased_at = now
+                self.set_rate(self.rate / 2)
+        elif result.status_code is None or result.status_code >= 500:
+            self.failures += 1
+            if self.failures >= self.breaker_threshold and not self.is_open():
+                self.open()
+        else:
+            self.failures = 0
+
+    def set_rate(self, rate):
+        self.rate = min(max(rate, self.min_rate), self.max_rate)
+        self.bucket.set_rate(self.rate)
+
+    def open(self):
+        self.open_until = time.time() + self.breaker_recovery
+        cache.set(self.BREAKER_KEY, self.open_until, timeout=self.breaker_recovery)
+        metrics.circuit_breaker_opened.inc()
+        logger.warning('Telegram API is failing, pausing dispatch for %s s', self.breaker_recovery)
+
+    def save(self):
+        cache.set(self.RATE_KEY, self.rate, timeout=None)
+
+
+class TelegramDispatcher:
+    """
+    Send batches of messages via the Telegram bot API concurrently.
+
+    All requests of a batch share one keep-alive connection pool and at most 'max_concurrency' of them are in flight
+    at once. The SendController paces the batch with a global token bucket that starts at 'global_rate' messages per
+    second and adapts to throttling, and every chat gets its own token bucket of 'chat_rate' messages per second.
+    A message throttled with a 'retry_after' of no more than 'max_retry_after' seconds is sent again up to
+    'max_retries' times once its chat's bucket allows it. While the circuit breaker is open, messages are not sent.
+    Messages that cannot be started before the batch's deadline are not sent either.
+    """
+
+    def __init__(self, base_url=None, token=None, max_concurrency=None, global_rate=None, chat_rate=None,
+                 timeout=None, transport=None, max_retries=None, max_retry_after=None):
+        self.base_url = base_url or settings.TELEGRAM_API_URL
+        self.token = token or TG_ACCESS_TOKEN
+        self.max_concurrency = max_concurrency or settings.TELEGRAM_MAX_CONCURRENCY
+        self.global_rate = global_rate or settings.TELEGRAM_GLOBAL_RATE_LIMIT
+        self.chat_rate = chat_rate or settings.TELEGRAM_CHAT_RATE_LIMIT
+        self.timeout = timeout or settings.TELEGRAM_REQUEST_TIMEOUT
+        self.transport = transport
+        self.max_retries = settings.TELEGRAM_SEND_RETRIES if max_retries is None else max_retries
+        self.max_retry_after = settings.TELEGRAM_MAX_RETRY_AFTER if max_retry_after is None else max_retry_after
+
+    @staticmethod
+    def is_paused():
+        """ Whether the circuit breaker currently holds back all messages. """
+
+        return SendController.is_paused()
+
+    def send_batch(self, messages, deadline=None):
+        """
+        Send the messages and return a SendResult for each of them, in the same order.
+
+        No request is started after the time.monotonic() 'deadline'. Messages that were not tried by then get a
+        SendResult with 'attempted' False and a 'retry_after' of 0, messages whose retry would start after it keep the
+        result of their last attempt.
+        """
+
+        messages = [TelegramMessage(*message) for message in messages]
+        if not messages:
+            return []
+        return asyncio.run(self._send_batch(messages, deadline))
+
+    async def _send_batch(self, messages, deadline=None):
+        limits = httpx.Limits(max_connections=self.max_concurrency,
+                              max_keepalive_connections=self.max_concurrency)
+        results = [None] * len(messages)
+
+        by_chat = defaultdict(list)
+        for index, message in enumerate(messages):
+            if message.chat_id:
+                by_chat[message.chat_id].append(index)
+            else:
+                results[index] = SendResult(message.key, False, error='The user has no Telegram chat_id.')
+                metrics.send_failures.inc(label_value='no_chat')
+
+        controller = SendController(self.global_rate, settings.TELEGRAM_MIN_RATE_LIMIT,
+                                    settings.TELEGRAM_RATE_INCREASE, settings.TELEGRAM_BREAKER_THRESHOLD,
+                                    settings.TELEGRAM_BREAKER_RECOVERY)
+
+        async with httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=self.timeout,
+                                     transport=self.transport) as client:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+
+            async def send_chat(indexes):
+                chat_bucket = TokenBucket(self.chat_rate)
+                for index in indexes:
+                    message = messages[index]
+                    for attempt in range(self.max_retries + 1):
+                        if not controller.is_open():
+                            if not (await chat_bucket.acquire(deadline)
+                                    and await controller.bucket.acquire(deadline)):
+                                if attempt == 0:
+                                    results[index] = SendResult(message.key, False, retry_after=0, attempted=False,
+                                                                error='The batch ran out of time.')
+                                break
+                        if controller.is_open():
+                            if attempt == 0:
+                                results[index] = SendResult(message.key, False, error='The circuit breaker is open.',
+                                                            retry_after=controller.open_until - time.time(),
+                                                            attempted=False)
+                            break
+                        async with semaphore:
+                            result = await self._send(client, message)
+                        controller.record(result)
+                        results[index] = result
+                        if result.status_code != 429 or result.retry_after is None \
+                                or result.retry_after > self.max_retry_after or attempt == self.max_retries:
+                            break
+                        chat_bucket.block(result.retry_after)
+                        metrics.send_retries.inc()
+
+            await asyncio.gather(*(send_chat(indexes) for indexes in by_chat.values()))
+
+        controller.save()
+        return results
+
+    async def _send(self, client, message):
+        data = {
+            'chat_id': message.chat_id,
+            'text': message.text
+        }
+
+        started_at = time.monotonic()
+        try:
+            response = await client.post(f'/bot{self.token}/{METHOD_NAME}', json=data)
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            metrics.send_seconds.observe(time.monotonic() - started_at)
+            status_code = e.response.status_code
+            if status_code == 429:
+                reason = 'throttled'
+            elif status_code < 500:
+                reason = 'client_error'
+            else:
+                reason = 'server_error'
+            metrics.send_failures.inc(label_value=reason)
+            error = f'{status_code} {e.response.reason_phrase}'
+            logger.warning('Error while sending a message via Telegram: %s', error)
+            return SendResult(message.key, False, status_code, error, get_retry_after(e.response))
+        except httpx.HTTPError as e:
+            metrics.send_seconds.observe(time.monotonic() - started_at)
+            metrics.send_failures.inc(label_value='timeout' if isinstance(e, httpx.TimeoutException) else 'network')
+            error = f'{type(e).__name__}: {e}'
+            logger.warning('Error while sending a message via Telegram: %s', error)
+            return SendResult(message.key, False, error=error)
+        metrics.send_seconds.observe(time.monotonic() - started_at)
+        metrics.messages_sent.inc()
+        return SendResult(message.key, True, response.status_code)
+
+
+def get_retry_after(response):
+    """
+    Return the number of seconds a throttled Telegram API response asks to wait, or None.
+
+    The bot API reports it in 'parameters.retry_after' of the JSON body, other proxies in the Retry-After header.
+    """
+
+    if response.status_code != 429:
+        return None
+    try:
+        retry_after = response.json()['parameters']['retry_after']
+    except (ValueError, KeyError, TypeError):
+        retry_after = response.headers.get('Retry-After')
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return None
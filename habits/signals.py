@@ -0,0 +1,84 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from habits.feeds import OwnHabitsCache, PublicHabitFeed
+from habits.models import Habit
+from habits.scheduler import HabitTimerWheel, get_timer_wheel
+from users.models import User
+
+
+@receiver(post_save, sender=User)
+def reschedule_user_habits(sender, instance, created, update_fields=None, **kwargs):
+    """ Move the notifications of the user's habits to the user's time zone when it may have changed. """
+
+    if created or (update_fields is not None and 'timezone' not in update_fields):
+        return
+
+    habits = Habit.objects.filter(owner=instance)
+    habits.reschedule()
+    if HabitTimerWheel.is_enabled():
+        fire_times = list(habits.values_list('pk', 'next_fire_at'))
+        transaction.on_commit(lambda: get_timer_wheel().add(fire_times))
+
+
+@receiver(post_save, sender=Habit)
+def add_habit_to_timer_wheel(sender, instance, **kwargs):
+    """ Put the habit on the timer wheel with its new 'next_fire_at'. """
+
+    if HabitTimerWheel.is_enabled():
+        fire_times = [(instance.pk, instance.next_fire_at)]
+        transaction.on_commit(lambda: get_timer_wheel().add(fire_times))
+
+
+@receiver(post_delete, sender=Habit)
+def remove_habit_from_timer_wheel(sender, instance, **kwargs):
+    """ Take the deleted habit off the timer wheel. """
+
+    if HabitTimerWheel.is_enabled():
+        habit_id = instance.pk
+        transaction.on_commit(lambda: get_timer_wheel().remove([habit_id]))
+
+
+@receiver(post_save, sender=Habit)
+def invalidate_public_feed_on_save(sender, instance, created, **kwargs):
+    """ Drop the cached public feed when a public habit is created or a habit that may have been public changes. """
+
+    if instance.is_public or not created and instance.may_be_in_public_feed():
+        transaction.on_commit(PublicHabitFeed.invalidate)
+    instance.was_public = instance.is_public
+
+
+@receiver(post_delete, sender=Habit)
+def invalidate_public_feed_on_delete(sender, instance, **kwargs):
+    """ Drop the cached public feed when a public habit is deleted. """
+
+    if instance.is_public:
+        transaction.on_commit(PublicHabitFeed.invalidate)
+
+
+def habits_bulk_saved(habits, created):
+    """
+    Do for habits written with bulk_create() or bulk_update(), which send no signals, what the post_save receivers
+    of Habit do for every saved habit.
+    """
+
+    if HabitTimerWheel.is_enabled():
+        fire_times = [(habit.pk, habit.next_fire_at) for habit in habits]
+        transaction.on_commit(lambda: get_timer_wheel().add(fire_times))
+
+    if any(habit.is_public or not created and habit.may_be_in_public_feed() for habit in habits):
+        transaction.on_commit(PublicHabitFeed.invalidate)
+    for habit in habits:
+        habit.was_public = habit.is_public
+
+    for owner_id in {habit.owner_id for habit in habits}:
+        transaction.on_commit(OwnHabitsCache(owner_id).invalidate)
+
+
+@receiver(post_save, sender=Habit)
+@receiver(post_delete, sender=Habit)
+def invalidate_own_habits(sender, instance, **kwargs):
+    """ Drop the cached pages of the owner's habits list when one of their habits is written. """
+
+    transaction.on_commit(OwnHabitsCache(instance.owner_id).invalidate)
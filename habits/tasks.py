@@ -1,39 +1,253 @@
-from celery import shared_task
-from datetime import datetime, date
-from django.db.models import Q, F
+import logging
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
 
-from habits.models import Habit
-from habits.services import telegram_bot
+from celery import chord, shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.functions import Mod
+from django.utils import timezone
+
+from habits import metrics
+from habits.models import NOTIFICATION_MAX_DELAY, Habit, NotificationOutbox
+from habits.scheduler import HabitTimerWheel, get_timer_wheel
+from habits.services import TelegramDispatcher, render_catch_up_notifications, render_notifications
+
+logger = logging.getLogger(__name__)
+
+DRAIN_LOCK_KEY = 'notifications:drain_lock'
 
 
 @shared_task
 def send_notifications():
     """
-    Send notifications for habits to Telegram.
+    Schedule notifications for habits.
+
+    This Celery task fans the tick out into NOTIFICATION_SHARDS 'send_notifications_shard' tasks, each of which handles
+    the habits of one bucket of owners, so the tick is spread over all available workers. When all shards are done
+    'report_notification_totals' sums up their results.
+    """
+
+    shards = settings.NOTIFICATION_SHARDS
+    header = (send_notifications_shard.s(shard, shards) for shard in range(shards))
+    return chord(header)(report_notification_totals.s())
+
+
+@shared_task
+def send_notifications_shard(shard, shards):
+    """
+    Schedule notifications for the habits of one bucket of owners.
+
+    This Celery task handles habits that are due by the end of the current minute and whose 'owner_id' modulo
+    'shards' equals 'shard'. 'next_fire_at' holds the UTC instant of the habit's local time, so the due habits are a
+    single range scan over the 'habits_next_fire_at_idx' index whatever the time zones of their owners.
+
+    The due habits are claimed in batches of NOTIFICATION_CLAIM_BATCH_SIZE with SELECT ... FOR UPDATE SKIP LOCKED,
+    so overlapping ticks and concurrent workers never schedule the same habit twice. The habits of each batch are
+    coalesced into one message per chat, a digest when several habits of a user are due at once, and written to the
+    NotificationOutbox in the same transaction that updates their last_notification field to the owner's local date,
+    which moves 'next_fire_at' to the next period. 'drain_notification_outbox' delivers the messages.
+    """
+
+    now = timezone.now()
+    due_habits = Habit.objects.due(now).alias(owner_shard=Mod('owner_id', shards)).filter(owner_shard=shard)
+    return schedule_notifications(due_habits)
+
+
+@shared_task
+def send_habit_notifications(habit_ids):
+    """
+    Schedule notifications for habits popped from the timer wheel by 'manage.py run_timer_wheel'.
+
+    Habits that are no longer due, because they were rescheduled after they had been put on the wheel, are skipped.
+    The habits are put back on the wheel with their current 'next_fire_at' afterwards, except those that are more
+    than NOTIFICATION_MAX_DELAY overdue: their past fire time would pop them again at once, so they are left to
+    'catch_up_notifications', which puts them back when it realigns them.
+    """
+
+    now = timezone.now()
+    due_habits = Habit.objects.filter(pk__in=habit_ids, next_fire_at__lte=now,
+                                      next_fire_at__gte=now - NOTIFICATION_MAX_DELAY)
+    totals = schedule_notifications(due_habits)
+    habits = Habit.objects.filter(pk__in=habit_ids).exclude(pk__in=Habit.objects.missed(now).values('pk'))
+    get_timer_wheel().add(habits.values_list('pk', 'next_fire_at'))
+    return totals
 
-    This Celery task sends notifications for habits that need to be performed today to the respective users' Telegram chats.
 
-    The task fetches habits where the last notification date is yesterday or null (indicating it's the first day of the habit),
-     and sends a notification with the habit's details to the user's Telegram chat.
+def schedule_notifications(due_habits, render=render_notifications, advance=Habit.objects.mark_notified):
+    """
+    Claim the habits of 'due_habits' in batches of NOTIFICATION_CLAIM_BATCH_SIZE, write the messages built by
+    'render' to the NotificationOutbox, move the habits on with 'advance' and return the totals.
 
-    The last_notification field is then updated to today.
+    'render' takes the claimed DueHabit records and returns TelegramMessages, 'advance' takes their ids.
     """
 
-    today = date.today()
-    now = datetime.now()
+    totals = Counter(due=0, messages=0)
+
+    try:
+        while True:
+            with transaction.atomic():
+                started_at = time.monotonic()
+                habits = due_habits.claim(settings.NOTIFICATION_CLAIM_BATCH_SIZE)
+                metrics.claim_seconds.observe(time.monotonic() - started_at)
+                if not habits:
+                    break
+
+                owners = {habit.chat_id: habit.owner_id for habit in habits}
+                fire_times = {habit.pk: habit.next_fire_at for habit in habits}
+                messages = [message for message in render(habits) if message.chat_id]
+                NotificationOutbox.objects.bulk_create(
+                    NotificationOutbox(owner_id=owners[message.chat_id], chat_id=message.chat_id, text=message.text,
+                                       scheduled_for=min(fire_times[pk] for pk in message.key))
+                    for message in messages
+                )
+                advance(habit.pk for habit in habits)
+
+            totals['due'] += len(habits)
+            totals['messages'] += len(messages)
+            metrics.claim_batch_size.observe(len(habits))
+            metrics.habits_due.inc(len(habits))
+            metrics.messages_scheduled.inc(len(messages))
+    finally:
+        metrics.flush()
 
-    filtered_habits = Habit.objects.filter(
-        Q(last_notification=today - F('days')) |
-        Q(last_notification__isnull=True, start_date=today)
-    )
+    if totals['messages']:
+        drain_notification_outbox.delay()
+    return dict(totals)
+
+
+@shared_task
+def catch_up_notifications(policy=None):
+    """
+    Realign the habits whose notifications were missed, for example while the workers were down.
+
+    This Celery task finds the habits that are more than NOTIFICATION_MAX_DELAY overdue with one range scan over the
+    'habits_next_fire_at_idx' index and claims them in batches like 'send_notifications_shard'. With the 'notify'
+    policy every owner gets one consolidated message listing their missed habits, with the 'skip' policy nobody is
+    notified. Either way the habits are moved to the next fire time of their cycle with one UPDATE per batch, and put
+    back on the timer wheel when it is in use. The policy defaults to NOTIFICATION_CATCH_UP_POLICY.
+    """
+
+    policy = policy or settings.NOTIFICATION_CATCH_UP_POLICY
+    if policy not in ('notify', 'skip'):
+        raise ValueError(f'Unknown catch-up policy: {policy}')
+
+    now = timezone.now()
+
+    def realign(habit_ids):
+        habit_ids = list(habit_ids)
+        Habit.objects.realign(habit_ids, now)
+        if HabitTimerWheel.is_enabled():
+            fire_times = list(Habit.objects.filter(pk__in=habit_ids).values_list('pk', 'next_fire_at'))
+            transaction.on_commit(lambda: get_timer_wheel().add(fire_times))
+
+    render = render_catch_up_notifications if policy == 'notify' else lambda habits: []
+    totals = schedule_notifications(Habit.objects.missed(now), render, realign)
+    metrics.habits_missed.inc(totals['due'], label_value=policy)
+    metrics.flush()
+
+    if totals['due']:
+        logger.info('Notification catch-up: %(due)s missed habits, %(messages)s messages scheduled', totals)
+    return totals
+
+
+@shared_task
+def report_notification_totals(shard_totals):
+    """
+    Sum up the results of the 'send_notifications_shard' tasks of one tick and log them.
+    """
+
+    totals = Counter(due=0, messages=0)
+    for shard_total in shard_totals:
+        totals.update(shard_total)
+
+    logger.info('Notifications: %(due)s habits due, %(messages)s messages scheduled', totals)
+    return dict(totals)
+
+
+def get_outbox_batch_size():
+    """
+    Return NOTIFICATION_OUTBOX_BATCH_SIZE, reduced to the number of messages that can be sent within
+    NOTIFICATION_OUTBOX_LEASE at TELEGRAM_MIN_RATE_LIMIT when every message is retried TELEGRAM_SEND_RETRIES times.
+    """
+
+    sendable = settings.NOTIFICATION_OUTBOX_LEASE.total_seconds() * settings.TELEGRAM_MIN_RATE_LIMIT \
+        / (settings.TELEGRAM_SEND_RETRIES + 1)
+    return max(1, min(settings.NOTIFICATION_OUTBOX_BATCH_SIZE, int(sendable)))
+
+
+@shared_task
+def drain_notification_outbox():
+    """
+    Deliver the pending messages of the NotificationOutbox to Telegram.
+
+    This Celery task claims the messages that are ready to be sent in batches of NOTIFICATION_OUTBOX_BATCH_SIZE and
+    hands each batch to the TelegramDispatcher. Delivered messages are marked as sent. A failed message is retried
+    with exponential backoff starting at NOTIFICATION_OUTBOX_RETRY_BACKOFF, or after the 'retry_after' Telegram asked
+    for, and is moved to the dead-letter state after NOTIFICATION_OUTBOX_MAX_ATTEMPTS attempts. While the dispatcher's
+    circuit breaker is open no batches are claimed, and messages it held back, or could not send before the lease of
+    the batch ran out, are put back without counting an attempt.
+
+    Only one drainer runs at a time, so the dispatcher's global and per-chat rate limits hold for the whole
+    deployment; a drainer started while another one is running returns at once. The lock lives in the Django cache
+    and is extended by a lease before every batch, so a drainer that died releases it when the lease expires. A
+    drainer that finds its lock expired or taken over stops, and only releases the lock while it still holds it.
+    Batches are no larger than can be sent within the lease at TELEGRAM_MIN_RATE_LIMIT with every retry used up, so
+    neither the lock nor the leases of the messages in flight run out while the API is throttling.
+    """
 
-    for habit in filtered_habits:
-        text = f'Я буду {habit.action} в {habit.location} в {habit.time}'
+    totals = Counter(sent=0, failed=0, dead=0)
+    lease_seconds = settings.NOTIFICATION_OUTBOX_LEASE.total_seconds()
+    lock_token = uuid.uuid4().hex
+    if not cache.add(DRAIN_LOCK_KEY, lock_token, timeout=lease_seconds):
+        return dict(totals)
 
-        telegram_bot(habit.owner.chat_id, text)
-        habit.last_notification = today
-        habit.save()
+    batch_size = get_outbox_batch_size()
+    dispatcher = TelegramDispatcher()
+    try:
+        while not dispatcher.is_paused():
+            if cache.get(DRAIN_LOCK_KEY) != lock_token or not cache.touch(DRAIN_LOCK_KEY, timeout=lease_seconds):
+                logger.warning('Notification outbox: the drain lock was lost, stopping')
+                break
+            # The lease is measured from the claim, so it holds however long the drain has been running. No request
+            # is started after the lease less a request timeout, so the messages are never sent while another drainer
+            # may claim them.
+            deadline = time.monotonic() + lease_seconds - settings.TELEGRAM_REQUEST_TIMEOUT
+            messages = NotificationOutbox.objects.claim(timezone.now(), batch_size, settings.NOTIFICATION_OUTBOX_LEASE)
+            if not messages:
+                break
 
+            results = dispatcher.send_batch([(message, message.chat_id, message.text) for message in messages],
+                                            deadline)
+            sent_at = timezone.now()
+            delivered = [result.key for result in results if result.ok]
+            totals['sent'] += NotificationOutbox.objects.mark_sent((message.pk for message in delivered), sent_at)
+            for message in delivered:
+                if message.scheduled_for is not None:
+                    metrics.delivery_lag_seconds.observe((sent_at - message.scheduled_for).total_seconds())
 
+            held = [result for result in results if not result.attempted]
+            if held:
+                resume_at = sent_at + timedelta(seconds=max(result.retry_after for result in held))
+                NotificationOutbox.objects.postpone((result.key.pk for result in held), resume_at)
 
+            failures = [(result.key, result.error, result.retry_after)
+                        for result in results if not result.ok and result.attempted]
+            dead = NotificationOutbox.objects.mark_failed(
+                failures, sent_at, settings.NOTIFICATION_OUTBOX_MAX_ATTEMPTS,
+                settings.NOTIFICATION_OUTBOX_RETRY_BACKOFF
+            )
+            totals['failed'] += len(failures)
+            totals['dead'] += dead
+            metrics.messages_dead.inc(dead)
+    finally:
+        if cache.get(DRAIN_LOCK_KEY) == lock_token:
+            cache.delete(DRAIN_LOCK_KEY)
+        metrics.flush()
 
+    if totals['sent'] or totals['failed']:
+        logger.info('Notification outbox: %(sent)s sent, %(failed)s failed, %(dead)s dead', totals)
+    return dict(totals)
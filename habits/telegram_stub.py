@@ -0,0 +1,86 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class TelegramStubHandler(BaseHTTPRequestHandler):
+    """ Answers 'sendMessage' calls of the Telegram bot API the way the TelegramStubServer is configured to. """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        if not self.path.endswith('/sendMessage'):
+            return self.respond(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+
+        if server.latency:
+            time.sleep(max(random.gauss(server.latency, server.jitter), 0))
+
+        roll = random.random()
+        if roll < server.throttle_rate:
+            return self.respond(429, {
+                'ok': False,
+                'error_code': 429,
+                'description': f'Too Many Requests: retry after {server.retry_after}',
+                'parameters': {'retry_after': server.retry_after},
+            })
+        if roll < server.throttle_rate + server.error_rate:
+            return self.respond(500, {'ok': False, 'error_code': 500, 'description': 'Internal Server Error'})
+
+        message = json.loads(body or b'{}')
+        server.record(message)
+        self.respond(200, {'ok': True, 'result': {'chat': {'id': message.get('chat_id')}, 'text': message.get('text')}})
+
+    def respond(self, status, payload):
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TelegramStubServer(ThreadingHTTPServer):
+    """
+    A local stand-in for the Telegram bot API 'sendMessage' endpoint.
+
+    Every request waits 'latency' seconds (normally distributed with 'jitter'), a 'throttle_rate' share of them is
+    answered with 429 and 'retry_after', and an 'error_rate' share with 500. Delivered messages are kept in
+    'delivered' as (monotonic time, chat_id, text) tuples.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0,
+                 retry_after=1):
+        super().__init__(address, TelegramStubHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.delivered = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def record(self, message):
+        with self.lock:
+            self.delivered.append((time.monotonic(), message.get('chat_id'), message.get('text')))
+
+    def start(self):
+        """ Serve in a background thread. """
+
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
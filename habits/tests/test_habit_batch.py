@@ -0,0 +1,181 @@
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from habits.models import Habit
+from users.models import User
+
+
+class TestHabitBatch(APITestCase):
+    """
+        Test cases for creating, updating and deleting habits in batches.
+    """
+
+    def setUp(self):
+        """
+            Set up data for each test case.
+        """
+
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='test_user',
+            password='testpassword',
+            telegram_id='@test_user_tg'
+        )
+        self.other_user = User.objects.create_user(
+            username='other_user',
+            password='testpassword',
+            telegram_id='@other_user_tg'
+        )
+        self.client.force_authenticate(user=self.user)
+
+        self.habit_data = {
+            "action": "test_habit",
+            "location": "test_location",
+            "time": "08:00",
+            "periodicity": "daily",
+            "execution_time": 60,
+            "start_date": "2023-10-24",
+        }
+        self.pleasant_habit = Habit.objects.create(owner=self.user, **{**self.habit_data, 'is_pleasant': True})
+
+    def test_batch_create(self):
+        """
+            Test creating a batch of habits with related habits in a constant number of queries.
+        """
+
+        batch = [
+            {**self.habit_data, 'action': f'habit {i}', 'periodicity': 'weekly',
+             'related_habit': self.pleasant_habit.pk}
+            for i in range(20)
+        ]
+
+        with self.assertNumQueries(4):
+            response = self.client.post('/habits/batch/create', batch, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        results = response.json()
+        self.assertEqual([item['action'] for item in results], [f'habit {i}' for i in range(20)])
+        habit = Habit.objects.get(pk=results[0]['id'])
+        self.assertEqual(habit.owner, self.user)
+        self.assertEqual(habit.related_habit, self.pleasant_habit)
+        self.assertEqual(habit.days, 7)
+        self.assertEqual(habit.next_fire_at, habit.get_next_fire_at())
+
+    def test_batch_create_reports_errors_per_item(self):
+        """
+            Test that an invalid item rejects the whole batch with the errors of every item.
+        """
+
+        other_habit = Habit.objects.create(owner=self.other_user, **{**self.habit_data, 'is_pleasant': True})
+        batch = [
+            self.habit_data,
+            {**self.habit_data, 'related_habit': other_habit.pk},
+            {**self.habit_data, 'related_habit': 0},
+            {**self.habit_data, 'periodicity': 'hourly'},
+        ]
+
+        response = self.client.post('/habits/batch/create', batch, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = response.json()
+        self.assertEqual(errors[0], {})
+        self.assertEqual(errors[1], {'related_habit': ['Error: Only your own habits can be related to this habit.']})
+        self.assertEqual(errors[2], {'related_habit': ['Invalid pk "0" - object does not exist.']})
+        self.assertIn('periodicity', errors[3])
+        self.assertEqual(Habit.objects.count(), 2)
+
+    @override_settings(HABIT_BATCH_MAX_SIZE=2)
+    def test_batch_size_is_bounded(self):
+        """
+            Test that empty batches and batches over HABIT_BATCH_MAX_SIZE are rejected.
+        """
+
+        response = self.client.post('/habits/batch/create', [self.habit_data] * 3, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post('/habits/batch/create', [], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post('/habits/batch/create', self.habit_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_update(self):
+        """
+            Test updating a batch of the user's habits in a constant number of queries.
+        """
+
+        habits = Habit.objects.bulk_create(
+            Habit(owner=self.user, days=1, **{**self.habit_data, 'action': f'habit {i}'}) for i in range(10)
+        )
+        Habit.objects.filter(pk=habits[0].pk).update(last_notification='2023-11-01')
+        batch = [{'id': habit.pk, 'action': f'changed {habit.pk}', 'periodicity': 'every_other_day'}
+                 for habit in habits]
+        batch[0]['start_date'] = '2024-01-01'
+
+        with self.assertNumQueries(4):
+            response = self.client.patch('/habits/batch/edit', batch, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.json()], [habit.pk for habit in habits])
+
+        for habit in Habit.objects.filter(pk__in=[habit.pk for habit in habits]):
+            self.assertEqual(habit.action, f'changed {habit.pk}')
+            self.assertEqual(habit.days, 2)
+            self.assertEqual(habit.next_fire_at, habit.get_next_fire_at())
+        self.assertIsNone(Habit.objects.get(pk=habits[0].pk).last_notification)
+
+    def test_batch_update_of_other_users_habits_is_rejected(self):
+        """
+            Test that a batch update cannot change the habits of other users.
+        """
+
+        other_habit = Habit.objects.create(owner=self.other_user, **self.habit_data)
+
+        response = self.client.patch('/habits/batch/edit', [
+            {'id': self.pleasant_habit.pk, 'action': 'changed'},
+            {'id': other_habit.pk, 'action': 'changed'},
+            {'action': 'changed'},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = response.json()
+        self.assertEqual(errors[0], {})
+        self.assertIn('id', errors[1])
+        self.assertIn('id', errors[2])
+        self.assertEqual(Habit.objects.get(pk=other_habit.pk).action, 'test_habit')
+        self.assertEqual(Habit.objects.get(pk=self.pleasant_habit.pk).action, 'test_habit')
+
+    def test_batch_delete(self):
+        """
+            Test deleting a batch of the user's habits, and that nothing is deleted if one of them is not found.
+        """
+
+        habits = Habit.objects.bulk_create(
+            Habit(owner=self.user, days=1, **{**self.habit_data, 'action': f'habit {i}'}) for i in range(3)
+        )
+        other_habit = Habit.objects.create(owner=self.other_user, **self.habit_data)
+
+        response = self.client.delete('/habits/batch/delete', [{'id': habits[0].pk}, {'id': other_habit.pk}],
+                                      format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()[0], {})
+        self.assertTrue(Habit.objects.filter(pk=habits[0].pk).exists())
+
+        response = self.client.delete('/habits/batch/delete', [{'id': habit.pk} for habit in habits], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), [{'id': habit.pk} for habit in habits])
+        self.assertFalse(Habit.objects.filter(pk__in=[habit.pk for habit in habits]).exists())
+        self.assertTrue(Habit.objects.filter(pk=other_habit.pk).exists())
+
+    def test_batch_writes_invalidate_own_habits_cache(self):
+        """
+            Test that the cached own habits list is refreshed after batch writes.
+        """
+
+        self.assertEqual(len(self.client.get('/habits').json()['results']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/habits/batch/create', [self.habit_data, self.habit_data], format='json')
+        self.assertEqual(len(self.client.get('/habits').json()['results']), 3)
+
+        habit_id = response.json()[0]['id']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch('/habits/batch/edit', [{'id': habit_id, 'action': 'changed'}], format='json')
+        self.assertIn('changed', [item['action'] for item in self.client.get('/habits').json()['results']])
@@ -1,3 +1,5 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APITestCase
 
@@ -89,7 +91,77 @@ class TestHabitDetail(APITestCase):
         response_data = response.json()
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_habit_detail_is_one_query(self):
+        """
+            Test that the habit and its owner are loaded with a single query.
+        """
+
+        habit = Habit.objects.create(**self.habit_data)
+
+        self.client.force_authenticate(user=self.user)
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/habits/{habit.id}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_habit_detail_of_private_habit(self):
+        """
+            Test that a private habit is only shown to its owner, and that a missing habit is not found.
+        """
+
+        habit = Habit.objects.create(**{**self.habit_data, 'is_public': False})
 
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get(f'/habits/{habit.id}').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get(f'/habits/{habit.id + 1}').status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(user=self.owner_user)
+        self.assertEqual(self.client.get(f'/habits/{habit.id}').status_code, status.HTTP_200_OK)
 
+    def test_habit_detail_conditional_get(self):
+        """
+            Test that a request with a matching ETag gets 304 until the habit changes.
+        """
+
+        habit = Habit.objects.create(**self.habit_data)
+
+        self.client.force_authenticate(user=self.user)
+        etag = self.client.get(f'/habits/{habit.id}')['ETag']
+
+        response = self.client.get(f'/habits/{habit.id}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        self.client.force_authenticate(user=self.owner_user)
+        response = self.client.get(f'/habits/{habit.id}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+        habit.action = 'changed_habit'
+        habit.save()
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(f'/habits/{habit.id}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['action'], 'changed_habit')
+
+    def test_habit_detail_sparse_fields(self):
+        """
+            Test that only the requested fields are loaded and returned, within the fields the user may see.
+        """
+
+        habit = Habit.objects.create(**{**self.habit_data, 'reward': 'test_reward', 'is_pleasant': False})
+
+        self.client.force_authenticate(user=self.owner_user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/habits/{habit.id}', {'fields': 'action,reward'})
+        self.assertEqual(response.json(), {'action': 'test_public_habit', 'reward': 'test_reward'})
+        self.assertNotIn('"location"', queries.captured_queries[0]['sql'])
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(f'/habits/{habit.id}', {'fields': 'action,reward'})
+        self.assertEqual(response.json(), {'action': 'test_public_habit'})
 
+        for fields in ('action,unknown', 'last_notification', ''):
+            response = self.client.get(f'/habits/{habit.id}', {'fields': fields})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, fields)
 
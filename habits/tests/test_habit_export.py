@@ -0,0 +1,107 @@
+import csv
+import io
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from habits.models import Habit
+from habits.serializers import HabitExportSerializer
+from users.models import User
+
+
+class TestHabitExport(APITestCase):
+    """
+        Test cases for exporting habits as NDJSON and CSV.
+    """
+
+    def setUp(self):
+        """
+            Set up data for each test case.
+        """
+
+        self.user = User.objects.create_user(
+            username='test_user',
+            password='testpassword',
+            telegram_id='@test_user_tg'
+        )
+        self.other_user = User.objects.create_user(
+            username='other_user',
+            password='testpassword',
+            telegram_id='@other_user_tg'
+        )
+
+        habit_data = {
+            "action": "test_habit",
+            "location": "test_location",
+            "time": "08:00",
+            "periodicity": "daily",
+            "execution_time": 60,
+            "start_date": "2023-10-24",
+        }
+        pleasant_habit = Habit.objects.create(owner=self.user, **{**habit_data, 'is_pleasant': True})
+        for i in range(4):
+            Habit.objects.create(owner=self.user, **{**habit_data, 'action': f'habit, "{i}"',
+                                                     'related_habit': pleasant_habit})
+        Habit.objects.create(owner=self.other_user, **habit_data)
+
+    def expected(self, habits):
+        return json.loads(json.dumps(HabitExportSerializer(habits.order_by('id'), many=True).data))
+
+    @override_settings(HABIT_EXPORT_CHUNK_SIZE=2)
+    def test_export_ndjson(self):
+        """
+            Test that the user's habits are streamed as NDJSON in chunks.
+        """
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get('/habits/export')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.expected(Habit.objects.filter(owner=self.user)))
+
+    def test_export_csv(self):
+        """
+            Test that the user's habits are streamed as CSV with a header row.
+        """
+
+        self.client.force_authenticate(user=self.user)
+        for response in (self.client.get('/habits/export', {'format': 'csv'}),
+                         self.client.get('/habits/export', HTTP_ACCEPT='text/csv')):
+            self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+            rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+            expected = self.expected(Habit.objects.filter(owner=self.user))
+            self.assertEqual([row['action'] for row in rows], [habit['action'] for habit in expected])
+            self.assertEqual(list(rows[0]), list(HabitExportSerializer.Meta.fields))
+
+    def test_export_requires_authentication(self):
+        """
+            Test that habits are not exported to unauthenticated users.
+        """
+
+        response = self.client.get('/habits/export')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_export_command(self):
+        """
+            Test exporting the habits of one user and of all users with the management command.
+        """
+
+        stdout = io.StringIO()
+        call_command('export_habits', '--user', 'test_user', stdout=stdout)
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.expected(Habit.objects.filter(owner=self.user)))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'habits.csv')
+            call_command('export_habits', '--all', '--format', 'csv', '--output', path, '--chunk-size', '2')
+            with open(path, newline='') as output:
+                rows = list(csv.DictReader(output))
+        self.assertEqual([int(row['id']) for row in rows], [habit['id'] for habit in self.expected(Habit.objects)])
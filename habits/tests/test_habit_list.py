@@ -1,7 +1,15 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import ModelSerializer
 from rest_framework.test import APITestCase
 
+from habits.feeds import PublicHabitFeed, get_or_fill
 from habits.models import Habit
+from habits.serializers import HabitListSerializer, HabitSearchSerializer, ValuesSerializer
+from habits.views import OwnHabitsListApiView, PublicHabitsListApiView
 from users.models import User
 
 
@@ -15,6 +23,7 @@ class TestHabitList(APITestCase):
             Set up data for each test case.
         """
 
+        cache.clear()
         self.owner_user = User.objects.create_user(
             username='owner_user',
             password='testpassword',
@@ -58,19 +67,19 @@ class TestHabitList(APITestCase):
 
         public_habit_data = self.habit_data
 
-        private_habit_data = public_habit_data
+        private_habit_data = {**public_habit_data}
         private_habit_data['is_public'] = False
         private_habit_data['action'] = 'test_private_habit'
 
-        Habit.objects.create(public_habit_data)
+        Habit.objects.create(**public_habit_data)
 
-        Habit.objects.create(private_habit_data)
+        Habit.objects.create(**private_habit_data)
 
         self.client.force_authenticate(user=self.user)
         response = self.client.get('/habits/public')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.json()), 1)
-        self.assertEqual(response.json(), [{'action': 'test_public_habit', 'periodicity': 'daily'}])
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertEqual(response.json()['results'], [{'action': 'test_public_habit', 'periodicity': 'daily'}])
 
 
     def test_own_habits_list(self):
@@ -87,10 +96,277 @@ class TestHabitList(APITestCase):
         response_data = response.json()
         self.assertEqual(response_data['results'], [{'action': 'test_public_habit', 'periodicity': 'daily'}])
 
+    def test_own_habits_list_cursor_pagination(self):
+        """
+            Test that the own habits list is paged with a cursor, in the order of creation.
+        """
+
+        for index in range(7):
+            Habit.objects.create(**{**self.habit_data, 'action': f'habit_{index}'})
+
+        self.client.force_authenticate(user=self.owner_user)
+        response = self.client.get('/habits')
+        first_page = response.json()
+        self.assertEqual([habit['action'] for habit in first_page['results']], [f'habit_{index}' for index in range(5)])
+        self.assertIsNone(first_page['previous'])
+        self.assertNotIn('count', first_page)
+
+        response = self.client.get(first_page['next'])
+        second_page = response.json()
+        self.assertEqual([habit['action'] for habit in second_page['results']], ['habit_5', 'habit_6'])
+        self.assertIsNone(second_page['next'])
+
+    def test_public_habits_list_page_size_is_bounded(self):
+        """
+            Test that the public habits list never returns more than the maximum page size.
+        """
+
+        Habit.objects.bulk_create(
+            Habit(**{**self.habit_data, 'days': 1, 'start_date': '2023-10-24'}) for _ in range(60)
+        )
 
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get('/habits/public', {'page_size': 100})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()['results']), 50)
+        self.assertIsNotNone(response.json()['next'])
 
+    def test_public_feed_is_served_from_cache(self):
+        """
+            Test that a repeated request for the public feed does not query the database.
+        """
 
+        Habit.objects.create(**self.habit_data)
+        self.client.force_authenticate(user=self.user)
+        first = self.client.get('/habits/public').json()
+
+        with self.assertNumQueries(0):
+            second = self.client.get('/habits/public').json()
+        self.assertEqual(first, second)
+
+    def test_public_feed_excludes_own_habits(self):
+        """
+            Test that the cached public feed leaves out the requesting user's own habits.
+        """
+
+        Habit.objects.create(**self.habit_data)
+        Habit.objects.create(**{**self.habit_data, 'owner': self.user, 'action': 'own_habit'})
 
+        for user, actions in ((self.user, ['test_public_habit']), (self.owner_user, ['own_habit'])):
+            self.client.force_authenticate(user=user)
+            response = self.client.get('/habits/public')
+            self.assertEqual([habit['action'] for habit in response.json()['results']], actions)
+
+    def test_public_feed_is_invalidated_on_change(self):
+        """
+            Test that creating, changing and deleting public habits is reflected in the cached feed.
+        """
+
+        self.client.force_authenticate(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            habit = Habit.objects.create(**self.habit_data)
+        self.assertEqual(len(self.client.get('/habits/public').json()['results']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            habit.is_public = False
+            habit.save()
+        self.assertEqual(self.client.get('/habits/public').json()['results'], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            habit.is_public = True
+            habit.save()
+        self.assertEqual(len(self.client.get('/habits/public').json()['results']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            habit.delete()
+        self.assertEqual(self.client.get('/habits/public').json()['results'], [])
+
+    def test_public_feed_is_kept_on_private_changes(self):
+        """
+            Test that changing private habits, one by one or in batches, does not invalidate the cached feed.
+        """
+
+        habit = Habit.objects.create(**{**self.habit_data, 'is_public': False})
+        version = PublicHabitFeed.get_version()
+
+        habit = Habit.objects.get(pk=habit.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            habit.action = 'changed'
+            habit.save()
+        self.assertEqual(PublicHabitFeed.get_version(), version)
+
+        self.client.force_authenticate(user=self.owner_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch('/habits/batch/edit', [{'id': habit.pk, 'action': 'changed again'}], format='json')
+        self.assertEqual(PublicHabitFeed.get_version(), version)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            habit.is_public = True
+            habit.save()
+        self.assertNotEqual(PublicHabitFeed.get_version(), version)
+
+    @patch.object(PublicHabitFeed, 'block_size', 3)
+    def test_public_feed_pages_across_blocks(self):
+        """
+            Test that following the next and previous links walks the whole feed in both directions.
+        """
+
+        owners = (self.owner_user, self.user)
+        habits = [
+            Habit.objects.create(**{**self.habit_data, 'owner': owners[index % 3 == 0], 'action': f'habit_{index}'})
+            for index in range(12)
+        ]
+        expected = [habit.action for habit in habits if habit.owner == self.owner_user]
+
+        self.client.force_authenticate(user=self.user)
+        pages = []
+        url = '/habits/public?page_size=3'
+        while url:
+            page = self.client.get(url).json()
+            pages.append([habit['action'] for habit in page['results']])
+            url = page['next']
+        self.assertEqual(sum(pages, []), expected)
+        self.assertTrue(all(len(actions) == 3 for actions in pages[:-1]))
+
+        previous_pages = []
+        url = page['previous']
+        while url:
+            page = self.client.get(url).json()
+            previous_pages.insert(0, [habit['action'] for habit in page['results']])
+            url = page['previous']
+        self.assertEqual(previous_pages, pages[:-1])
+
+    @patch('habits.feeds.FILL_WAIT_ATTEMPTS', 1)
+    def test_refill_is_done_by_one_process(self):
+        """
+            Test that a missing feed key is refilled only by the process holding the refill lock.
+        """
+
+        def loader():
+            return ['value']
+
+        cache.add('test_key:lock', 1)
+        self.assertEqual(get_or_fill('test_key', loader, 60), ['value'])
+        self.assertIsNone(cache.get('test_key'))
+
+        cache.delete('test_key:lock')
+        self.assertEqual(get_or_fill('test_key', loader, 60), ['value'])
+        self.assertEqual(cache.get('test_key'), ['value'])
+
+    def test_own_habits_list_is_served_from_cache(self):
+        """
+            Test that an unchanged list of own habits is served without queries and refreshed after a write.
+        """
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Habit.objects.create(**self.habit_data)
+        self.client.force_authenticate(user=self.owner_user)
+        first = self.client.get('/habits').json()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/habits').json(), first)
+        self.assertEqual(len(self.client.get('/habits', {'page_size': 1}).json()['results']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Habit.objects.create(**{**self.habit_data, 'action': 'new_habit'})
+        response = self.client.get('/habits').json()
+        self.assertEqual([habit['action'] for habit in response['results']], ['test_public_habit', 'new_habit'])
+
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get('/habits').json()['results'], [])
+
+    def test_own_habits_list_filtering_and_ordering(self):
+        """
+            Test filtering the own habits list by periodicity and by time of day, ordered by time.
+        """
+
+        for action, time, periodicity in (('early', '06:00', 'daily'), ('late', '21:00', 'weekly'),
+                                          ('noon', '12:00', 'daily')):
+            Habit.objects.create(**{**self.habit_data, 'action': action, 'time': time, 'periodicity': periodicity})
+
+        self.client.force_authenticate(user=self.owner_user)
+        response = self.client.get('/habits', {'periodicity': 'daily'})
+        self.assertEqual([habit['action'] for habit in response.json()['results']], ['early', 'noon'])
+
+        response = self.client.get('/habits', {'time_after': '09:00', 'ordering': '-time'})
+        self.assertEqual([habit['action'] for habit in response.json()['results']], ['late', 'noon'])
+
+    def test_habits_list_rejects_unindexed_filters(self):
+        """
+            Test that invalid values and combinations of filters without an index are rejected.
+        """
+
+        self.client.force_authenticate(user=self.owner_user)
+        for path, params in (
+            ('/habits', {'periodicity': 'daily', 'is_pleasant': 'true'}),
+            ('/habits', {'periodicity': 'daily', 'ordering': 'time'}),
+            ('/habits', {'periodicity': 'yearly'}),
+            ('/habits', {'ordering': 'action'}),
+            ('/habits/public', {'is_public': 'false'}),
+        ):
+            response = self.client.get(path, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_public_habits_list_filtering(self):
+        """
+            Test filtering the public habits list, which bypasses the cached feed.
+        """
+
+        Habit.objects.create(**self.habit_data)
+        Habit.objects.create(**{**self.habit_data, 'action': 'useful_habit', 'is_pleasant': False})
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get('/habits/public', {'is_pleasant': 'false'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['results'], [{'action': 'useful_habit', 'periodicity': 'daily'}])
+
+    def test_filter_indexes_exist(self):
+        """
+            Test that every supported combination of filters is served by an index of the Habit model.
+        """
+
+        index_names = {index.name for index in Habit._meta.indexes}
+        for view in (OwnHabitsListApiView, PublicHabitsListApiView):
+            self.assertLessEqual(set(view.filter_indexes.values()), index_names)
+
+    def test_habits_list_sparse_fields(self):
+        """
+            Test that the list endpoints return only the requested fields.
+        """
+
+        Habit.objects.create(**self.habit_data)
+
+        self.client.force_authenticate(user=self.owner_user)
+        response = self.client.get('/habits', {'fields': 'periodicity'})
+        self.assertEqual(response.json()['results'], [{'periodicity': 'daily'}])
+        self.assertEqual(self.client.get('/habits', {'fields': 'reward'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(user=self.user)
+        for params in ({'fields': 'action'}, {'fields': 'action', 'ordering': 'time'}):
+            response = self.client.get('/habits/public', params)
+            self.assertEqual(response.json()['results'], [{'action': 'test_public_habit'}])
+
+
+    def test_values_serializer_output_is_identical(self):
+        """
+            Test that ValuesSerializer renders values() rows to the same JSON as the model serializer renders habits.
+        """
 
+        class HabitAllFieldsSerializer(ModelSerializer):
+            class Meta:
+                model = Habit
+                fields = '__all__'
 
+        pleasant_habit = Habit.objects.create(**self.habit_data)
+        Habit.objects.create(**{**self.habit_data, 'action': 'Ünïcode "quoted" action', 'is_pleasant': False,
+                                'is_public': False, 'related_habit': pleasant_habit, 'time': '23:59:30'})
+        Habit.objects.create(**{**self.habit_data, 'is_pleasant': False, 'reward': 'cake', 'location': ''})
 
+        for serializer_class in (HabitListSerializer, HabitSearchSerializer, HabitAllFieldsSerializer):
+            serializer = serializer_class()
+            habits = Habit.objects.order_by('id')
+            rows = habits.values(*(field.source for field in serializer._readable_fields))
+            self.assertEqual(
+                JSONRenderer().render(ValuesSerializer(serializer).to_representation(rows)),
+                JSONRenderer().render(serializer_class(habits, many=True).data),
+            )
@@ -0,0 +1,598 @@
+import json
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from time import time as wall_time
+from unittest.mock import patch
+
+import httpx
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from habits.models import Habit, NotificationOutbox
+from habits.services import SendController, SendResult, TelegramDispatcher
+from habits.tasks import (DRAIN_LOCK_KEY, catch_up_notifications, drain_notification_outbox, get_outbox_batch_size,
+                          report_notification_totals, send_notifications, send_notifications_shard)
+from users.models import User
+
+
+def send_batch(messages, deadline=None):
+    """ Stand-in for TelegramDispatcher.send_batch that reports every message as sent. """
+    return [SendResult(key, True, 200) for key, chat_id, text in messages]
+
+
+def fail_batch(messages, deadline=None):
+    """ Stand-in for TelegramDispatcher.send_batch that reports every message as failed. """
+    return [SendResult(key, False, 502, '502 Bad Gateway') for key, chat_id, text in messages]
+
+
+def throttle_batch(messages, deadline=None):
+    """ Stand-in for TelegramDispatcher.send_batch that reports every message as throttled for two minutes. """
+    return [SendResult(key, False, 429, '429 Too Many Requests', 120) for key, chat_id, text in messages]
+
+
+def hold_batch(messages, deadline=None):
+    """ Stand-in for TelegramDispatcher.send_batch whose circuit breaker holds back every message. """
+    return [SendResult(key, False, error='The circuit breaker is open.', retry_after=30, attempted=False)
+            for key, chat_id, text in messages]
+
+
+@patch('habits.tasks.drain_notification_outbox.delay')
+class TestHabitNotifications(TestCase):
+    """
+        Test cases for scheduling habit notifications.
+    """
+
+    def setUp(self):
+        """
+            Set up data for each test case.
+        """
+
+        self.user = User.objects.create_user(
+            username='test_user',
+            password='testpassword',
+            telegram_id='@test_user_tg',
+            chat_id='12345'
+        )
+
+        self.now = timezone.now()
+        self.habit_data = {
+            "owner": self.user,
+            "action": "test_habit",
+            "location": "test_location",
+            "time": self.now.time().replace(second=0, microsecond=0),
+            "periodicity": "every_other_day",
+            "execution_time": "60",
+            "start_date": timezone.localdate(self.now),
+        }
+
+    def test_next_fire_at_on_create(self, drain):
+        """
+            Test that a new habit is scheduled for its start date and time.
+        """
+
+        habit = Habit.objects.create(**{**self.habit_data, 'time': '08:30', 'start_date': '2023-10-24'})
+
+        self.assertEqual(habit.next_fire_at, timezone.make_aware(datetime(2023, 10, 24, 8, 30)))
+
+    def test_next_fire_at_after_notification(self, drain):
+        """
+            Test that the next notification is scheduled one period after the last one.
+        """
+
+        habit = Habit.objects.create(**{**self.habit_data, 'time': time(8, 30), 'start_date': date(2023, 10, 24)})
+        habit.last_notification = date(2023, 10, 24)
+        habit.save(update_fields=['last_notification'])
+
+        habit.refresh_from_db()
+        self.assertEqual(habit.next_fire_at, timezone.make_aware(datetime(2023, 10, 26, 8, 30)))
+
+    def test_schedule_due_habit(self, drain):
+        """
+            Test that a habit due in the current minute is written to the outbox and rescheduled.
+        """
+
+        habit = Habit.objects.create(**self.habit_data)
+
+        totals = send_notifications_shard(0, 1)
+
+        self.assertEqual(totals, {'due': 1, 'messages': 1})
+        message = NotificationOutbox.objects.get()
+        self.assertEqual((message.owner, message.chat_id, message.status), (self.user, '12345', 'pending'))
+        self.assertTrue(message.text.startswith('Я буду test_habit в test_location'))
+        drain.assert_called_once()
+
+        habit.refresh_from_db()
+        self.assertEqual(habit.last_notification, timezone.localdate(self.now))
+        self.assertEqual(habit.next_fire_at.date(), timezone.localdate(self.now) + timedelta(days=2))
+
+    def test_schedule_skips_habits_not_due(self, drain):
+        """
+            Test that habits scheduled for later or for a past day are not scheduled.
+        """
+
+        Habit.objects.create(**{**self.habit_data, 'start_date': timezone.localdate(self.now) + timedelta(days=1)})
+        Habit.objects.create(**{**self.habit_data, 'start_date': timezone.localdate(self.now) - timedelta(days=1)})
+
+        totals = send_notifications_shard(0, 1)
+
+        self.assertEqual(totals, {'due': 0, 'messages': 0})
+        self.assertFalse(NotificationOutbox.objects.exists())
+        drain.assert_not_called()
+
+    def test_schedule_digest(self, drain):
+        """
+            Test that habits of one user due at the same time are scheduled as a single digest message.
+        """
+
+        for i in range(3):
+            Habit.objects.create(**{**self.habit_data, 'action': f'habit_{i}'})
+
+        totals = send_notifications_shard(0, 1)
+
+        self.assertEqual(totals, {'due': 3, 'messages': 1})
+        self.assertTrue(NotificationOutbox.objects.get().text.startswith('Я буду:\n- habit_0 в test_location'))
+
+    def test_schedule_without_chat_id(self, drain):
+        """
+            Test that habits of a user who has not started the bot are advanced without a message.
+        """
+
+        self.user.chat_id = None
+        self.user.save()
+        habit = Habit.objects.create(**self.habit_data)
+
+        totals = send_notifications_shard(0, 1)
+
+        self.assertEqual(totals, {'due': 1, 'messages': 0})
+        self.assertFalse(NotificationOutbox.objects.exists())
+        habit.refresh_from_db()
+        self.assertEqual(habit.last_notification, timezone.localdate(self.now))
+
+    def test_schedule_shard_handles_own_owners(self, drain):
+        """
+            Test that a shard schedules only the habits of owners in its bucket.
+        """
+
+        other_user = User.objects.create_user(
+            username='other_user',
+            password='testpassword',
+            telegram_id='@other_user_tg',
+            chat_id='67890'
+        )
+        habit = Habit.objects.create(**self.habit_data)
+        other_habit = Habit.objects.create(**{**self.habit_data, 'owner': other_user})
+
+        totals = send_notifications_shard(habit.owner_id % 2, 2)
+
+        self.assertEqual(totals, {'due': 1, 'messages': 1})
+        self.assertEqual(NotificationOutbox.objects.get().chat_id, '12345')
+
+        other_habit.refresh_from_db()
+        self.assertIsNone(other_habit.last_notification)
+
+    def test_send_notifications_fans_out_to_shards(self, drain):
+        """
+            Test that the beat task runs every shard and reports the totals.
+        """
+
+        with self.settings(NOTIFICATION_SHARDS=3), patch('habits.tasks.chord') as chord:
+            send_notifications()
+
+        header = list(chord.call_args.args[0])
+        self.assertEqual([signature.args for signature in header], [(0, 3), (1, 3), (2, 3)])
+        self.assertEqual(chord.return_value.call_args.args[0].task, 'habits.tasks.report_notification_totals')
+
+    def test_report_notification_totals(self, drain):
+        """
+            Test that the shard results are summed up.
+        """
+
+        totals = report_notification_totals([{'due': 2, 'messages': 2}, {'due': 3, 'messages': 1}])
+
+        self.assertEqual(totals, {'due': 5, 'messages': 3})
+
+    def test_claim(self, drain):
+        """
+            Test that claiming locks the requested number of due habits, completed with the rest of the last owner's.
+        """
+
+        other_user = User.objects.create_user(
+            username='other_user',
+            password='testpassword',
+            telegram_id='@other_user_tg',
+            chat_id='67890'
+        )
+        habits = [Habit.objects.create(**self.habit_data) for _ in range(3)]
+        other_habits = [Habit.objects.create(**{**self.habit_data, 'owner': other_user}) for _ in range(2)]
+        Habit.objects.create(**{**self.habit_data, 'start_date': timezone.localdate(self.now) + timedelta(days=1)})
+
+        self.assertEqual({habit.pk for habit in Habit.objects.due(self.now).claim(2)}, {habit.pk for habit in habits})
+        self.assertEqual(len(Habit.objects.due(self.now).claim(3)), 3)
+        self.assertEqual({habit.pk for habit in Habit.objects.due(self.now).claim(4)},
+                         {habit.pk for habit in habits + other_habits})
+
+    @override_settings(NOTIFICATION_CLAIM_BATCH_SIZE=2)
+    def test_schedule_digest_is_not_split_across_batches(self, drain):
+        """
+            Test that the habits of one user are scheduled as one digest even when they do not fit in one batch.
+        """
+
+        other_user = User.objects.create_user(
+            username='other_user',
+            password='testpassword',
+            telegram_id='@other_user_tg',
+            chat_id='67890'
+        )
+        for i in range(3):
+            Habit.objects.create(**{**self.habit_data, 'owner': other_user, 'action': f'other_{i}'})
+            Habit.objects.create(**{**self.habit_data, 'action': f'habit_{i}'})
+
+        totals = send_notifications_shard(0, 1)
+
+        self.assertEqual(totals, {'due': 6, 'messages': 2})
+        self.assertEqual(sorted(NotificationOutbox.objects.values_list('chat_id', flat=True)), ['12345', '67890'])
+
+    def test_mark_notified(self, drain):
+        """
+            Test that habits are moved to their next period in chunks without touching other habits.
+        """
+
+        habits = [Habit.objects.create(**{**self.habit_data, 'time': time(8, 30), 'start_date': date(2023, 10, 24)})
+                  for _ in range(3)]
+
+        updated = Habit.objects.mark_notified([habits[0].pk, habits[1].pk], chunk_size=1)
+
+        self.assertEqual(updated, 2)
+        for habit in habits:
+            habit.refresh_from_db()
+        self.assertEqual(habits[0].last_notification, date(2023, 10, 24))
+        self.assertEqual(habits[1].next_fire_at, timezone.make_aware(datetime(2023, 10, 26, 8, 30)))
+        self.assertIsNone(habits[2].last_notification)
+
+    def test_next_fire_at_in_owner_timezone(self, drain):
+        """
+            Test that the habit's time is read in the owner's time zone and stored in UTC.
+        """
+
+        self.user.timezone = 'Asia/Tokyo'
+        self.user.save()
+        habit = Habit.objects.create(**{**self.habit_data, 'time': time(8, 30), 'start_date': date(2023, 10, 24)})
+
+        self.assertEqual(habit.next_fire_at, datetime(2023, 10, 23, 23, 30, tzinfo=dt_timezone.utc))
+
+        Habit.objects.mark_notified([habit.pk])
+
+        habit.refresh_from_db()
+        self.assertEqual(habit.last_notification, date(2023, 10, 24))
+        self.assertEqual(habit.next_fire_at, datetime(2023, 10, 25, 23, 30, tzinfo=dt_timezone.utc))
+
+    def test_next_fire_at_across_dst(self, drain):
+        """
+            Test that the database and Python agree on fire times around daylight saving time transitions.
+        """
+
+        self.user.timezone = 'America/New_York'
+        self.user.save()
+
+        for start_date, fire_time in ((date(2024, 3, 8), time(2, 30)), (date(2024, 11, 1), time(1, 30))):
+            habit = Habit.objects.create(**{**self.habit_data, 'periodicity': 'daily', 'time': fire_time,
+                                            'start_date': start_date})
+            for _ in range(4):
+                Habit.objects.mark_notified([habit.pk])
+                habit.refresh_from_db()
+                self.assertEqual(habit.next_fire_at, habit.get_next_fire_at())
+
+        self.assertEqual(Habit.objects.get(start_date=date(2024, 3, 8), last_notification=date(2024, 3, 11))
+                         .next_fire_at, datetime(2024, 3, 12, 6, 30, tzinfo=dt_timezone.utc))
+
+    def test_reschedule_on_timezone_change(self, drain):
+        """
+            Test that changing the user's time zone moves the notifications of their habits.
+        """
+
+        habit = Habit.objects.create(**{**self.habit_data, 'time': time(8, 30), 'start_date': date(2023, 10, 24)})
+
+        self.user.timezone = 'Europe/Moscow'
+        self.user.save()
+
+        habit.refresh_from_db()
+        self.assertEqual(habit.next_fire_at, datetime(2023, 10, 24, 5, 30, tzinfo=dt_timezone.utc))
+
+    def test_realign_missed_habits(self, drain):
+        """
+            Test that missed habits are moved to the next fire time of their cycle after now.
+        """
+
+        habit = Habit.objects.create(**{**self.habit_data, 'time': time(8, 30), 'start_date': date(2023, 10, 24)})
+
+        for now, last_notification, next_fire_at in (
+            (datetime(2023, 10, 29, 10, tzinfo=dt_timezone.utc), date(2023, 10, 28), datetime(2023, 10, 30, 8, 30)),
+            (datetime(2023, 11, 1, 9, tzinfo=dt_timezone.utc), date(2023, 11, 1), datetime(2023, 11, 3, 8, 30)),
+        ):
+            self.assertEqual(list(Habit.objects.missed(now)), [habit])
+            Habit.objects.realign([habit.pk], now)
+
+            habit.refresh_from_db()
+            self.assertEqual(habit.last_notification, last_notification)
+            self.assertEqual(habit.next_fire_at, next_fire_at.replace(tzinfo=dt_timezone.utc))
+            self.assertEqual(habit.next_fire_at, habit.get_next_fire_at())
+            self.assertFalse(Habit.objects.missed(now).exists())
+            habit.next_fire_at -= timedelta(days=4)
+            Habit.objects.filter(pk=habit.pk).update(next_fire_at=habit.next_fire_at)
+
+    def test_catch_up_notifies_once_per_chat(self, drain):
+        """
+            Test that the owner of missed habits gets one consolidated message and the habits are realigned.
+        """
+
+        missed = [Habit.objects.create(**{**self.habit_data, 'start_date': self.now.date() - timedelta(days=5)})
+                  for _ in range(2)]
+        current = Habit.objects.create(**self.habit_data)
+
+        totals = catch_up_notifications('notify')
+
+        self.assertEqual(totals, {'due': 2, 'messages': 1})
+        message = NotificationOutbox.objects.get()
+        self.assertTrue(message.text.startswith('Пропущенные напоминания:'))
+        for habit in missed:
+            habit.refresh_from_db()
+            self.assertGreater(habit.next_fire_at, self.now)
+        self.assertEqual(Habit.objects.get(pk=current.pk).next_fire_at, current.next_fire_at)
+        drain.assert_called_once()
+
+    def test_catch_up_skip_policy(self, drain):
+        """
+            Test that the skip policy realigns missed habits without notifying anyone.
+        """
+
+        habit = Habit.objects.create(**{**self.habit_data, 'start_date': self.now.date() - timedelta(days=5)})
+
+        totals = catch_up_notifications('skip')
+
+        self.assertEqual(totals, {'due': 1, 'messages': 0})
+        self.assertFalse(NotificationOutbox.objects.exists())
+        habit.refresh_from_db()
+        self.assertGreater(habit.next_fire_at, self.now)
+        drain.assert_not_called()
+
+
+class TestNotificationOutbox(TestCase):
+    """
+        Test cases for delivering the messages of the notification outbox.
+    """
+
+    def setUp(self):
+        """
+            Set up data for each test case.
+        """
+
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='test_user',
+            password='testpassword',
+            telegram_id='@test_user_tg',
+            chat_id='12345'
+        )
+
+    def create_message(self, **kwargs):
+        return NotificationOutbox.objects.create(**{'owner': self.user, 'chat_id': '12345', 'text': 'test_message',
+                                                    **kwargs})
+
+    @patch('habits.tasks.TelegramDispatcher.send_batch', side_effect=send_batch)
+    def test_drain_sends_pending_messages(self, dispatch):
+        """
+            Test that ready messages are sent and marked as delivered, and that others are left alone.
+        """
+
+        message = self.create_message()
+        later = self.create_message(next_attempt_at=timezone.now() + timedelta(minutes=1))
+        sent_at = timezone.now() - timedelta(hours=1)
+        sent = self.create_message(status=NotificationOutbox.SENT, sent_at=sent_at)
+
+        totals = drain_notification_outbox()
+
+        self.assertEqual(totals, {'sent': 1, 'failed': 0, 'dead': 0})
+        self.assertEqual([key.pk for key, chat_id, text in dispatch.call_args.args[0]], [message.pk])
+        message.refresh_from_db()
+        self.assertEqual(message.status, NotificationOutbox.SENT)
+        self.assertIsNotNone(message.sent_at)
+        later.refresh_from_db()
+        self.assertEqual(later.status, NotificationOutbox.PENDING)
+        sent.refresh_from_db()
+        self.assertEqual(sent.sent_at, sent_at)
+
+    @patch('habits.tasks.TelegramDispatcher.send_batch', side_effect=fail_batch)
+    def test_drain_retries_with_backoff(self, dispatch):
+        """
+            Test that a failed message is retried later with a growing delay.
+        """
+
+        message = self.create_message(attempts=1)
+
+        with self.settings(NOTIFICATION_OUTBOX_RETRY_BACKOFF=timedelta(seconds=30)):
+            totals = drain_notification_outbox()
+
+        self.assertEqual(totals, {'sent': 0, 'failed': 1, 'dead': 0})
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), (NotificationOutbox.PENDING, 2))
+        self.assertEqual(message.last_error, '502 Bad Gateway')
+        self.assertGreater(message.next_attempt_at, timezone.now() + timedelta(seconds=50))
+
+    @patch('habits.tasks.TelegramDispatcher.send_batch', side_effect=fail_batch)
+    def test_drain_moves_poison_messages_to_dead_letter(self, dispatch):
+        """
+            Test that a message is given up on after the maximum number of attempts.
+        """
+
+        message = self.create_message(attempts=4)
+
+        with self.settings(NOTIFICATION_OUTBOX_MAX_ATTEMPTS=5):
+            totals = drain_notification_outbox()
+
+        self.assertEqual(totals, {'sent': 0, 'failed': 1, 'dead': 1})
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), (NotificationOutbox.DEAD, 5))
+
+    @patch('habits.tasks.TelegramDispatcher.send_batch', side_effect=throttle_batch)
+    def test_drain_honors_retry_after(self, dispatch):
+        """
+            Test that a throttled message is not retried before the retry_after Telegram asked for.
+        """
+
+        message = self.create_message()
+
+        drain_notification_outbox()
+
+        message.refresh_from_db()
+        self.assertEqual(message.attempts, 1)
+        self.assertGreater(message.next_attempt_at, timezone.now() + timedelta(seconds=110))
+
+    @patch('habits.tasks.TelegramDispatcher.send_batch', side_effect=hold_batch)
+    def test_drain_puts_back_held_messages(self, dispatch):
+        """
+            Test that messages held back by the circuit breaker are put back without counting an attempt.
+        """
+
+        message = self.create_message()
+
+        totals = drain_notification_outbox()
+
+        self.assertEqual(totals, {'sent': 0, 'failed': 0, 'dead': 0})
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), (NotificationOutbox.PENDING, 0))
+        self.assertGreater(message.next_attempt_at, timezone.now() + timedelta(seconds=20))
+
+    @patch('habits.tasks.TelegramDispatcher.send_batch', side_effect=send_batch)
+    def test_drain_pauses_while_circuit_breaker_is_open(self, dispatch):
+        """
+            Test that no messages are claimed while the circuit breaker is open.
+        """
+
+        self.create_message()
+        cache.set(SendController.BREAKER_KEY, wall_time() + 30)
+
+        totals = drain_notification_outbox()
+
+        self.assertEqual(totals, {'sent': 0, 'failed': 0, 'dead': 0})
+        dispatch.assert_not_called()
+
+    def test_long_drain_leases_every_batch_from_its_claim(self):
+        """
+            Test that the batches claimed late in a drain that outlasts the lease are still leased.
+        """
+
+        for _ in range(3):
+            self.create_message()
+        clock = [timezone.now()]
+        leased = []
+
+        def slow_send_batch(messages, deadline=None):
+            leases = NotificationOutbox.objects.filter(pk__in=[key.pk for key, chat_id, text in messages])
+            leased.extend(lease > clock[0] for lease in leases.values_list('next_attempt_at', flat=True))
+            clock[0] += timedelta(seconds=400)
+            return send_batch(messages, deadline)
+
+        with self.settings(NOTIFICATION_OUTBOX_BATCH_SIZE=1, NOTIFICATION_OUTBOX_LEASE=timedelta(seconds=300)), \
+                patch('habits.tasks.TelegramDispatcher.send_batch', side_effect=slow_send_batch), \
+                patch('habits.tasks.timezone.now', side_effect=lambda: clock[0]):
+            totals = drain_notification_outbox()
+
+        self.assertEqual(totals, {'sent': 3, 'failed': 0, 'dead': 0})
+        self.assertEqual(leased, [True, True, True])
+
+    def test_batch_that_outlasts_its_lease_is_put_back(self):
+        """
+            Test that messages a batch cannot send within its lease are put back and sent once by the next batch.
+        """
+
+        messages = [self.create_message(text=f'message {i}') for i in range(10)]
+        requests = []
+        batch_sizes = []
+
+        def handler(request):
+            requests.append(json.loads(request.content)['text'])
+            return httpx.Response(200, json={'ok': True})
+
+        class SlowDispatcher(TelegramDispatcher):
+            def __init__(self):
+                super().__init__(base_url='http://telegram.stub', token='token', chat_rate=10,
+                                 transport=httpx.MockTransport(handler))
+
+            def send_batch(self, messages, deadline=None):
+                batch_sizes.append(len(messages))
+                return super().send_batch(messages, deadline)
+
+        with self.settings(NOTIFICATION_OUTBOX_BATCH_SIZE=10, NOTIFICATION_OUTBOX_LEASE=timedelta(seconds=1),
+                           TELEGRAM_REQUEST_TIMEOUT=0.5, TELEGRAM_MIN_RATE_LIMIT=30), \
+                patch('habits.tasks.TelegramDispatcher', SlowDispatcher):
+            totals = drain_notification_outbox()
+
+        self.assertEqual(totals, {'sent': 10, 'failed': 0, 'dead': 0})
+        self.assertEqual(batch_sizes[0], 10)
+        self.assertGreater(len(batch_sizes), 1)
+        self.assertEqual(sorted(requests), sorted(message.text for message in messages))
+        self.assertFalse(NotificationOutbox.objects.exclude(attempts=0).exists())
+
+    @patch('habits.tasks.TelegramDispatcher.send_batch', side_effect=send_batch)
+    def test_drain_is_single_flight(self, dispatch):
+        """
+            Test that a drainer does nothing while another one is running, and releases the lock when it is done.
+        """
+
+        message = self.create_message()
+        cache.add(DRAIN_LOCK_KEY, 1)
+
+        self.assertEqual(drain_notification_outbox(), {'sent': 0, 'failed': 0, 'dead': 0})
+        dispatch.assert_not_called()
+
+        cache.delete(DRAIN_LOCK_KEY)
+        self.assertEqual(drain_notification_outbox(), {'sent': 1, 'failed': 0, 'dead': 0})
+        self.assertIsNone(cache.get(DRAIN_LOCK_KEY))
+        message.refresh_from_db()
+        self.assertEqual(message.status, NotificationOutbox.SENT)
+
+    def test_drain_stops_when_the_lock_is_lost(self):
+        """
+            Test that a drainer whose lock was taken over stops claiming and leaves the other drainer's lock alone.
+        """
+
+        for _ in range(3):
+            self.create_message()
+
+        def send_and_lose_lock(messages, deadline=None):
+            cache.set(DRAIN_LOCK_KEY, 'other_drainer')
+            return send_batch(messages, deadline)
+
+        with self.settings(NOTIFICATION_OUTBOX_BATCH_SIZE=1), \
+                patch('habits.tasks.TelegramDispatcher.send_batch', side_effect=send_and_lose_lock) as dispatch:
+            totals = drain_notification_outbox()
+
+        self.assertEqual(totals, {'sent': 1, 'failed': 0, 'dead': 0})
+        self.assertEqual(dispatch.call_count, 1)
+        self.assertEqual(cache.get(DRAIN_LOCK_KEY), 'other_drainer')
+
+    def test_batch_size_fits_in_the_lease(self):
+        """
+            Test that a batch is never larger than can be sent within the lease at the minimum rate with all retries.
+        """
+
+        with self.settings(NOTIFICATION_OUTBOX_BATCH_SIZE=500, NOTIFICATION_OUTBOX_LEASE=timedelta(seconds=300),
+                           TELEGRAM_MIN_RATE_LIMIT=1, TELEGRAM_SEND_RETRIES=2):
+            self.assertEqual(get_outbox_batch_size(), 100)
+        with self.settings(NOTIFICATION_OUTBOX_BATCH_SIZE=50):
+            self.assertEqual(get_outbox_batch_size(), 50)
+        with self.settings(NOTIFICATION_OUTBOX_LEASE=timedelta(seconds=1), TELEGRAM_MIN_RATE_LIMIT=0.1):
+            self.assertEqual(get_outbox_batch_size(), 1)
+
+    def test_claim_leases_messages(self):
+        """
+            Test that a claimed message is not claimed again until its lease expires.
+        """
+
+        self.create_message()
+        now = timezone.now()
+        lease = timedelta(minutes=5)
+
+        self.assertEqual(len(NotificationOutbox.objects.claim(now, 10, lease)), 1)
+        self.assertEqual(len(NotificationOutbox.objects.claim(now, 10, lease)), 0)
+        self.assertEqual(len(NotificationOutbox.objects.claim(now + lease, 10, lease)), 1)
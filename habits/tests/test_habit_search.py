@@ -0,0 +1,118 @@
+from django.db import connection
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from habits.models import Habit, has_trigram_extension
+from users.models import User
+
+
+class TestHabitSearch(APITestCase):
+    """
+        Test cases for searching public habits using the HabitSearch API endpoint.
+    """
+
+    def setUp(self):
+        """
+            Set up data for each test case.
+        """
+
+        self.owner_user = User.objects.create_user(
+            username='owner_user',
+            password='testpassword',
+            telegram_id='@owner_user'
+        )
+
+        self.user = User.objects.create_user(
+            username='test_user',
+            password='testpassword',
+            telegram_id='@test_user_tg'
+        )
+
+        self.habit_data = {
+            "owner": self.owner_user,
+            "action": "go running",
+            "location": "park",
+            "time": "00:00",
+            "periodicity": "daily",
+            "execution_time": "60",
+            "start_date": "2023-10-24",
+            "is_public": True,
+            "is_pleasant": True,
+        }
+
+    def search(self, text, **params):
+        self.client.force_authenticate(user=self.user)
+        return self.client.get('/habits/search', {'q': text, **params})
+
+    def test_search_matches_action_and_location(self):
+        """
+            Test that public habits are found by words of their action or location, ranked by relevance.
+        """
+
+        park = Habit.objects.create(**{**self.habit_data, 'action': 'read books', 'location': 'park'})
+        run = Habit.objects.create(**self.habit_data)
+        Habit.objects.create(**{**self.habit_data, 'action': 'read', 'location': 'home'})
+
+        response = self.search('runs in the park')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([habit['id'] for habit in response.json()['results']], [run.id])
+
+        response = self.search('park')
+        self.assertEqual({habit['id'] for habit in response.json()['results']}, {run.id, park.id})
+        self.assertEqual(response.json()['results'][0],
+                         {'id': park.id, 'action': 'read books', 'location': 'park', 'periodicity': 'daily'})
+
+    def test_search_only_public_habits_of_others(self):
+        """
+            Test that private habits and the user's own habits are not found.
+        """
+
+        Habit.objects.create(**{**self.habit_data, 'is_public': False})
+        Habit.objects.create(**{**self.habit_data, 'owner': self.user})
+
+        self.assertEqual(self.search('running').json()['results'], [])
+
+    def test_search_is_paginated(self):
+        """
+            Test that search results are paged without a count.
+        """
+
+        Habit.objects.bulk_create(Habit(**{**self.habit_data, 'days': 1}) for _ in range(3))
+
+        page = self.search('running', page_size=2).json()
+        self.assertEqual(len(page['results']), 2)
+        self.assertNotIn('count', page)
+        self.assertIsNone(page['previous'])
+
+        self.client.force_authenticate(user=self.user)
+        page = self.client.get(page['next']).json()
+        self.assertEqual(len(page['results']), 1)
+        self.assertIsNone(page['next'])
+
+    def test_search_rejects_invalid_pages(self):
+        """
+            Test that page numbers that are not integers or out of range give 404.
+        """
+
+        for page in ('abc', 0, 21):
+            response = self.search('running', page=page)
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_search_requires_query(self):
+        """
+            Test that a search without text is rejected.
+        """
+
+        self.assertEqual(self.search(' ').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_finds_misspelled_words(self):
+        """
+            Test that trigram similarity finds habits despite a typo.
+        """
+
+        if not has_trigram_extension(connection.alias):
+            self.skipTest('The pg_trgm extension is not installed.')
+
+        habit = Habit.objects.create(**{**self.habit_data, 'location': 'stadium'})
+
+        self.assertEqual([result['id'] for result in self.search('stadeum').json()['results']], [habit.id])
@@ -0,0 +1,92 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+import httpx
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from habits import metrics
+from habits.models import NotificationOutbox
+from habits.services import SendResult, TelegramDispatcher
+from habits.tasks import drain_notification_outbox
+from users.models import User
+
+
+class TestNotificationMetrics(APITestCase):
+    """
+        Test cases for recording and exposing the notification pipeline metrics.
+    """
+
+    def setUp(self):
+        """
+            Set up data for each test case.
+        """
+
+        metrics.flush()
+        cache.clear()
+
+        self.admin = User.objects.create_superuser(
+            username='admin_user',
+            password='testpassword',
+            telegram_id='@admin_user'
+        )
+
+        self.user = User.objects.create_user(
+            username='test_user',
+            password='testpassword',
+            telegram_id='@test_user_tg',
+            chat_id='12345'
+        )
+
+    def test_dispatcher_records_sends_and_failures(self):
+        """
+            Test that the dispatcher records send latency and failures by reason.
+        """
+
+        def handler(request):
+            return httpx.Response(429 if b'throttled' in request.content else 200, json={'ok': True})
+
+        dispatcher = TelegramDispatcher(base_url='http://telegram.stub', token='token', global_rate=1000,
+                                        chat_rate=1000, transport=httpx.MockTransport(handler))
+        dispatcher.send_batch([(1, '1', 'sent'), (2, '2', 'throttled'), (3, None, 'no chat')])
+        metrics.flush()
+
+        output = metrics.render_prometheus()
+        self.assertIn('habits_telegram_messages_sent_total 1\n', output)
+        self.assertIn('habits_telegram_send_failures_total{reason="throttled"} 1\n', output)
+        self.assertIn('habits_telegram_send_failures_total{reason="no_chat"} 1\n', output)
+        self.assertIn('habits_telegram_send_seconds_count 2\n', output)
+
+    @patch('habits.tasks.TelegramDispatcher.send_batch')
+    def test_drain_records_delivery_lag(self, send_batch):
+        """
+            Test that the drainer records the time between the scheduled fire time and the delivery.
+        """
+
+        send_batch.side_effect = lambda messages: [SendResult(key, True, 200) for key, chat_id, text in messages]
+        NotificationOutbox.objects.create(owner=self.user, chat_id='12345', text='test_message',
+                                          scheduled_for=timezone.now() - timedelta(seconds=40))
+
+        drain_notification_outbox()
+
+        output = metrics.render_prometheus()
+        self.assertIn('habits_notification_delivery_lag_seconds_bucket{le="30"} 0\n', output)
+        self.assertIn('habits_notification_delivery_lag_seconds_bucket{le="60"} 1\n', output)
+        self.assertIn('habits_notification_delivery_lag_seconds_count 1\n', output)
+
+    def test_metrics_endpoint(self):
+        """
+            Test that the metrics are served to admins only.
+        """
+
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get('/habits/metrics').status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get('/habits/metrics')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(b'# TYPE habits_notification_delivery_lag_seconds histogram', response.content)
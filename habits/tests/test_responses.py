@@ -0,0 +1,174 @@
+import datetime
+import gzip
+import json
+from decimal import Decimal
+from unittest import skipIf
+
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from habits import middleware, renderers
+from habits.middleware import CompressionMiddleware
+from habits.models import Habit
+from habits.renderers import FastJSONRenderer
+from users.models import User
+
+
+class TestResponses(APITestCase):
+    """
+        Test cases for JSON rendering, parsing and response compression.
+    """
+
+    def setUp(self):
+        """
+            Set up data for each test case.
+        """
+
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='test_user',
+            password='testpassword',
+            telegram_id='@test_user'
+        )
+        self.habit_data = {
+            "owner": self.user,
+            "action": "test_habit",
+            "location": "test_location",
+            "time": "08:00",
+            "periodicity": "daily",
+            "execution_time": "60",
+            "start_date": "2023-10-24",
+        }
+        self.client.force_authenticate(user=self.user)
+
+    def test_fast_renderer_output_is_identical(self):
+        """
+            Test that FastJSONRenderer renders the same bytes as DRF's JSONRenderer.
+        """
+
+        data = {
+            'results': [{'action': 'Ünïcode "quoted"\n ', 'periodicity': 'daily', 'id': 1}],
+            'detail': ErrorDetail('Not found.', code='not_found'),
+            'at': datetime.datetime(2024, 1, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+            'date': datetime.date(2024, 1, 1),
+            'time': datetime.time(8, 0),
+            'amount': Decimal('1.50'),
+            'values': (1, 2.5, None, True),
+            1: 'integer key',
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(data, 'application/json; indent=4'),
+                         JSONRenderer().render(data, 'application/json; indent=4'))
+
+    def test_fast_renderer_falls_back_for_unencodable_data(self):
+        """
+            Test that data orjson cannot encode is rendered by DRF's JSONRenderer, and that floats keep their values.
+        """
+
+        data = {'id': 2 ** 70, 'ids': [-2 ** 64]}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+        data = {'values': [1e20, 2.5, -1e-7]}
+        self.assertEqual(json.loads(FastJSONRenderer().render(data)), json.loads(JSONRenderer().render(data)))
+
+    def test_renderer_and_parser_fall_back_to_stdlib(self):
+        """
+            Test that the API works with the stdlib JSON encoder when orjson is not installed.
+        """
+
+        Habit.objects.create(**self.habit_data)
+        fast_response = self.client.get('/habits')
+
+        orjson = renderers.orjson
+        renderers.orjson = None
+        try:
+            cache.clear()
+            response = self.client.get('/habits')
+            create_response = self.client.post('/habits/create', {**self.habit_data, 'owner': None}, format='json')
+        finally:
+            renderers.orjson = orjson
+
+        self.assertEqual(response.content, fast_response.content)
+        self.assertEqual(create_response.status_code, status.HTTP_201_CREATED)
+
+    def test_invalid_json_is_rejected(self):
+        """
+            Test that a malformed JSON body is rejected with 400.
+        """
+
+        response = self.client.post('/habits/create', '{"action": ', content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('JSON parse error', response.json()['detail'])
+
+    def test_large_responses_are_compressed(self):
+        """
+            Test that responses over the size threshold are gzipped when the client accepts it.
+        """
+
+        Habit.objects.bulk_create(
+            Habit(**{**self.habit_data, 'action': f'habit {i}', 'days': 1}) for i in range(50)
+        )
+
+        response = self.client.get('/habits', {'page_size': 50}, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))['results']), 50)
+
+        response = self.client.get('/habits', {'page_size': 50}, HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+        response = self.client.get('/habits', {'page_size': 1}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_encoding_negotiation(self):
+        """
+            Test that the content coding preferred by the client is chosen.
+        """
+
+        brotli = middleware.brotli
+        try:
+            middleware.brotli = object()
+            self.assertEqual(CompressionMiddleware.get_encoding('gzip, deflate, br'), 'br')
+            self.assertEqual(CompressionMiddleware.get_encoding('gzip, br;q=0.5'), 'gzip')
+            self.assertEqual(CompressionMiddleware.get_encoding('*'), 'br')
+            self.assertIsNone(CompressionMiddleware.get_encoding('identity'))
+
+            middleware.brotli = None
+            self.assertEqual(CompressionMiddleware.get_encoding('br, gzip;q=0.5'), 'gzip')
+            self.assertIsNone(CompressionMiddleware.get_encoding('br'))
+        finally:
+            middleware.brotli = brotli
+
+    @skipIf(middleware.brotli is None, 'brotli is not installed')
+    def test_large_responses_are_compressed_with_brotli(self):
+        """
+            Test that responses are compressed with brotli when the client prefers it.
+        """
+
+        Habit.objects.bulk_create(
+            Habit(**{**self.habit_data, 'action': f'habit {i}', 'days': 1}) for i in range(50)
+        )
+
+        response = self.client.get('/habits', {'page_size': 50}, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(len(json.loads(middleware.brotli.decompress(response.content))['results']), 50)
+
+    @override_settings(RESPONSE_COMPRESSION_MIN_SIZE=100)
+    def test_conditional_get_with_weak_etag(self):
+        """
+            Test that the weak ETag of a compressed habit detail response still matches.
+        """
+
+        habit = Habit.objects.create(**{**self.habit_data, 'action': 'x' * 200})
+
+        response = self.client.get(f'/habits/{habit.pk}', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response['ETag'].startswith('W/'))
+
+        response = self.client.get(f'/habits/{habit.pk}', HTTP_ACCEPT_ENCODING='gzip',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
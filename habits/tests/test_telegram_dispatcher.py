@@ -0,0 +1,182 @@
+import json
+import time
+
+import httpx
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from habits.services import SendController, TelegramDispatcher
+from habits.telegram_stub import TelegramStubServer
+
+
+class TestTelegramDispatcher(SimpleTestCase):
+    """
+        Test cases for sending message batches with the TelegramDispatcher.
+    """
+
+    def setUp(self):
+        """
+            Set up a stub of the Telegram bot API for each test case.
+        """
+
+        cache.clear()
+        self.requests = []
+
+        def handler(request):
+            data = json.loads(request.content)
+            self.requests.append((time.monotonic(), data))
+            if data['chat_id'] == 'broken':
+                return httpx.Response(400, json={'ok': False, 'description': 'Bad Request: chat not found'})
+            if data['chat_id'] == 'down':
+                return httpx.Response(502, json={'ok': False, 'description': 'Bad Gateway'})
+            if data['text'].startswith('throttled') and len(self.requests) == 1:
+                retry_after = int(data['text'].split()[-1])
+                return httpx.Response(429, json={'ok': False, 'description': 'Too Many Requests',
+                                                 'parameters': {'retry_after': retry_after}})
+            return httpx.Response(200, json={'ok': True})
+
+        self.transport = httpx.MockTransport(handler)
+
+    def get_dispatcher(self, **kwargs):
+        options = {'base_url': 'http://telegram.stub', 'token': 'token', 'global_rate': 1000, 'chat_rate': 1000}
+        options.update(kwargs)
+        return TelegramDispatcher(transport=self.transport, **options)
+
+    def test_send_batch_returns_result_per_message(self):
+        """
+            Test that every message gets a result with its key, in the order of the batch.
+        """
+
+        results = self.get_dispatcher().send_batch([
+            (1, '100', 'first'),
+            (2, 'broken', 'second'),
+            (3, None, 'third'),
+            (4, '200', 'fourth'),
+        ])
+
+        self.assertEqual([result.key for result in results], [1, 2, 3, 4])
+        self.assertEqual([result.ok for result in results], [True, False, False, True])
+        self.assertEqual(results[1].status_code, 400)
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual(self.requests[0][1], {'chat_id': '100', 'text': 'first'})
+
+    def test_send_batch_respects_chat_rate(self):
+        """
+            Test that messages to the same chat are spaced out by the per-chat limit.
+        """
+
+        started_at = time.monotonic()
+        self.get_dispatcher(chat_rate=20).send_batch([
+            (1, '100', 'first'),
+            (2, '100', 'second'),
+            (3, '100', 'third'),
+        ])
+
+        self.assertGreaterEqual(self.requests[2][0] - started_at, 0.1)
+
+    def test_throttled_message_is_sent_again_after_retry_after(self):
+        """
+            Test that a message throttled with a short retry_after is sent again once it has passed.
+        """
+
+        result, = self.get_dispatcher().send_batch([(1, '100', 'throttled 1')])
+
+        self.assertTrue(result.ok)
+        self.assertEqual(len(self.requests), 2)
+        self.assertGreaterEqual(self.requests[1][0] - self.requests[0][0], 1)
+
+    def test_long_retry_after_is_returned(self):
+        """
+            Test that a message throttled for longer than the dispatcher waits is returned with its retry_after.
+        """
+
+        result, = self.get_dispatcher(max_retry_after=5).send_batch([(1, '100', 'throttled 60')])
+
+        self.assertFalse(result.ok)
+        self.assertEqual((result.status_code, result.retry_after), (429, 60))
+        self.assertEqual(len(self.requests), 1)
+
+    def test_throttling_lowers_send_rate(self):
+        """
+            Test that the global send rate is halved on throttling and the learned rate is kept for the next batch.
+        """
+
+        self.get_dispatcher(global_rate=40, max_retry_after=0).send_batch([(1, '100', 'throttled 1')])
+
+        self.assertEqual(cache.get(SendController.RATE_KEY), 20)
+
+    @override_settings(TELEGRAM_BREAKER_THRESHOLD=3)
+    def test_circuit_breaker_pauses_dispatch(self):
+        """
+            Test that consecutive server errors open the circuit breaker, which holds back the rest of the batch.
+        """
+
+        results = self.get_dispatcher(max_concurrency=1).send_batch([(index, 'down', 'test') for index in range(5)])
+
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual([result.attempted for result in results], [True] * 3 + [False] * 2)
+        self.assertGreater(results[-1].retry_after, 0)
+        self.assertTrue(TelegramDispatcher.is_paused())
+
+        self.get_dispatcher().send_batch([(1, '100', 'test')])
+        self.assertEqual(len(self.requests), 3)
+
+    def test_send_batch_stops_at_deadline(self):
+        """
+            Test that no request is started after the deadline and that the messages left are returned as not tried.
+        """
+
+        deadline = time.monotonic() + 0.25
+        results = self.get_dispatcher(global_rate=10).send_batch(
+            [(i, str(100 + i), f'message {i}') for i in range(5)], deadline
+        )
+
+        sent = [result for result in results if result.attempted]
+        held = [result for result in results if not result.attempted]
+        self.assertTrue(sent and held)
+        self.assertEqual(len(self.requests), len(sent))
+        self.assertTrue(all(result.ok for result in sent))
+        self.assertTrue(all(result.retry_after == 0 for result in held))
+        self.assertLessEqual(max(sent_at for sent_at, data in self.requests), deadline)
+
+    def test_send_empty_batch(self):
+        """
+            Test that an empty batch sends nothing.
+        """
+
+        self.assertEqual(self.get_dispatcher().send_batch([]), [])
+        self.assertEqual(self.requests, [])
+
+
+class TestTelegramStub(SimpleTestCase):
+    """
+        Test cases for the local Telegram bot API stub.
+    """
+
+    def setUp(self):
+        """
+            Reset the state the dispatcher keeps in the cache.
+        """
+
+        cache.clear()
+
+    def test_dispatcher_against_stub(self):
+        """
+            Test that the stub delivers messages and throttles the configured share of requests.
+        """
+
+        for throttle_rate, ok in ((0, True), (1, False)):
+            stub = TelegramStubServer(throttle_rate=throttle_rate, retry_after=30)
+            stub.start()
+            try:
+                dispatcher = TelegramDispatcher(base_url=stub.url, token='token', global_rate=1000)
+                result, = dispatcher.send_batch([(1, '100', 'test_message')])
+            finally:
+                stub.shutdown()
+                stub.server_close()
+
+            self.assertEqual(result.ok, ok)
+            self.assertEqual(result.status_code, 200 if ok else 429)
+            self.assertEqual(result.retry_after, None if ok else 30)
+            self.assertEqual([(chat_id, text) for _, chat_id, text in stub.delivered],
+                             [('100', 'test_message')] if ok else [])
@@ -0,0 +1,153 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from habits.models import Habit, NotificationOutbox
+from habits.scheduler import TIMER_WHEEL_KEY, HabitTimerWheel
+from habits.tasks import send_habit_notifications
+from users.models import User
+
+
+class TestHabitTimerWheel(SimpleTestCase):
+    """
+        Test cases for the Redis operations of the HabitTimerWheel.
+    """
+
+    def setUp(self):
+        """
+            Set up a timer wheel on a mocked Redis client for each test case.
+        """
+
+        self.client = MagicMock()
+        self.timer_wheel = HabitTimerWheel(client=self.client)
+
+    def test_add(self):
+        """
+            Test that habits are scored by their fire time and habits without one are removed.
+        """
+
+        fire_at = datetime(2023, 10, 24, 8, 30, tzinfo=dt_timezone.utc)
+
+        self.timer_wheel.add([(1, fire_at), (2, None)])
+
+        pipeline = self.client.pipeline.return_value
+        pipeline.zadd.assert_called_once_with(TIMER_WHEEL_KEY, {1: fire_at.timestamp()})
+        pipeline.zrem.assert_called_once_with(TIMER_WHEEL_KEY, 2)
+        pipeline.execute.assert_called_once()
+
+    def test_pop_due(self):
+        """
+            Test that due habits are popped by the script and returned as ids.
+        """
+
+        now = timezone.now()
+        self.timer_wheel.pop_due_script.return_value = [b'3', b'5']
+
+        self.assertEqual(self.timer_wheel.pop_due(now, 10), [3, 5])
+        self.timer_wheel.pop_due_script.assert_called_once_with(keys=[TIMER_WHEEL_KEY], args=[now.timestamp(), 10])
+
+    def test_rebuild(self):
+        """
+            Test that the wheel is filled under a temporary key and swapped in.
+        """
+
+        fire_at = datetime(2023, 10, 24, 8, 30, tzinfo=dt_timezone.utc)
+        self.client.zadd.return_value = 2
+
+        total = self.timer_wheel.rebuild([(1, fire_at), (2, fire_at)])
+
+        self.assertEqual(total, 2)
+        self.client.zadd.assert_called_once_with(f'{TIMER_WHEEL_KEY}:rebuild', {1: fire_at.timestamp(),
+                                                                                2: fire_at.timestamp()})
+        self.client.rename.assert_called_once_with(f'{TIMER_WHEEL_KEY}:rebuild', TIMER_WHEEL_KEY)
+
+
+@patch('habits.tasks.drain_notification_outbox.delay')
+class TestTimerWheelScheduling(TestCase):
+    """
+        Test cases for keeping the timer wheel in sync with the habits.
+    """
+
+    def setUp(self):
+        """
+            Set up data for each test case.
+        """
+
+        self.user = User.objects.create_user(
+            username='test_user',
+            password='testpassword',
+            telegram_id='@test_user_tg',
+            chat_id='12345'
+        )
+
+        self.now = timezone.now()
+        self.habit_data = {
+            "owner": self.user,
+            "action": "test_habit",
+            "location": "test_location",
+            "time": self.now.time().replace(second=0, microsecond=0),
+            "periodicity": "daily",
+            "execution_time": "60",
+            "start_date": timezone.localdate(self.now),
+        }
+
+    @patch('habits.tasks.get_timer_wheel')
+    def test_send_habit_notifications_leaves_missed_habits_to_catch_up(self, get_timer_wheel, drain):
+        """
+            Test that a popped habit that is too far overdue to be notified is not put back with its past fire time.
+        """
+
+        missed_habit = Habit.objects.create(**{**self.habit_data, 'start_date': self.habit_data['start_date']
+                                               - timedelta(days=5)})
+
+        totals = send_habit_notifications([missed_habit.pk])
+
+        self.assertEqual(totals, {'due': 0, 'messages': 0})
+        self.assertEqual(list(get_timer_wheel.return_value.add.call_args.args[0]), [])
+
+    @patch('habits.signals.get_timer_wheel')
+    def test_habit_changes_update_timer_wheel(self, get_timer_wheel, drain):
+        """
+            Test that creating and deleting a habit adds it to and removes it from the wheel.
+        """
+
+        with self.settings(NOTIFICATION_SCHEDULER='timer_wheel'):
+            with self.captureOnCommitCallbacks(execute=True):
+                habit = Habit.objects.create(**self.habit_data)
+            habit_id = habit.pk
+            with self.captureOnCommitCallbacks(execute=True):
+                habit.delete()
+
+        get_timer_wheel.return_value.add.assert_called_once_with([(habit_id, habit.next_fire_at)])
+        get_timer_wheel.return_value.remove.assert_called_once_with([habit_id])
+
+    @patch('habits.signals.get_timer_wheel')
+    def test_timer_wheel_disabled(self, get_timer_wheel, drain):
+        """
+            Test that the wheel is left alone when habits are scheduled by beat.
+        """
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Habit.objects.create(**self.habit_data)
+
+        get_timer_wheel.assert_not_called()
+
+    @patch('habits.tasks.get_timer_wheel')
+    def test_send_habit_notifications(self, get_timer_wheel, drain):
+        """
+            Test that popped habits that are due are scheduled and every popped habit is put back on the wheel.
+        """
+
+        habit = Habit.objects.create(**{**self.habit_data, 'time': (self.now - timedelta(minutes=1)).time()})
+        later_habit = Habit.objects.create(**{**self.habit_data, 'start_date': self.habit_data['start_date']
+                                              + timedelta(days=1)})
+
+        totals = send_habit_notifications([habit.pk, later_habit.pk])
+
+        self.assertEqual(totals, {'due': 1, 'messages': 1})
+        self.assertEqual(NotificationOutbox.objects.count(), 1)
+        habit.refresh_from_db()
+        fire_times = set(get_timer_wheel.return_value.add.call_args.args[0])
+        self.assertEqual(fire_times, {(habit.pk, habit.next_fire_at), (later_habit.pk, later_habit.next_fire_at)})
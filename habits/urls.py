@@ -1,8 +1,9 @@
 from django.urls import path
 
 from habits.apps import HabitsConfig
-from habits.views import (HabitCreateView, PublicHabitsListApiView, HabitDetailView,
-                          HabitUpdateView, HabitDeleteView, OwnHabitsListApiView)
+from habits.views import (HabitCreateView, PublicHabitsListApiView, HabitDetailView, HabitSearchApiView,
+                          HabitUpdateView, HabitDeleteView, OwnHabitsListApiView, NotificationMetricsView,
+                          HabitBatchCreateView, HabitBatchUpdateView, HabitBatchDeleteView, HabitExportView)
 
 app_name = HabitsConfig.name
 
@@ -11,9 +12,17 @@ urlpatterns = [
     path('habits', OwnHabitsListApiView.as_view(), name='own-habit-list'),
 
     path('habits/public', PublicHabitsListApiView.as_view(), name='public-habit-list'),
+    path('habits/search', HabitSearchApiView.as_view(), name='habit-search'),
+    path('habits/export', HabitExportView.as_view(), name='habit-export'),
 
     path('habits/<int:pk>', HabitDetailView.as_view(), name='habit-detail'),
     path('habits/edit/<int:pk>', HabitUpdateView.as_view(), name='habit-list'),
-    path('habits/delete/<int:pk>', HabitDeleteView.as_view(), name='habit-list')
+    path('habits/delete/<int:pk>', HabitDeleteView.as_view(), name='habit-list'),
+
+    path('habits/batch/create', HabitBatchCreateView.as_view(), name='habit-batch-create'),
+    path('habits/batch/edit', HabitBatchUpdateView.as_view(), name='habit-batch-edit'),
+    path('habits/batch/delete', HabitBatchDeleteView.as_view(), name='habit-batch-delete'),
+
+    path('habits/metrics', NotificationMetricsView.as_view(), name='notification-metrics'),
 
 ]
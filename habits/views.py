@@ -1,11 +1,50 @@
-from rest_framework import generics
-from rest_framework.exceptions import NotFound
-from rest_framework.permissions import IsAuthenticated
+import hashlib
+
+from django.db import transaction
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import generics, status
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from habits.exports import export_habits
+from habits.feeds import OwnHabitsCache
+from habits.filters import IndexedHabitFilter
+from habits.metrics import render_prometheus
 
 from habits.models import Habit
-from habits.paginators import HabitPaginator
-from habits.permissions import IsOwner
-from habits.serializers import HabitCreateUpdateSerializer, HabitListSerializer, HabitDetailSerializer
+from habits.paginators import HabitPaginator, HabitSearchPaginator, PublicHabitPaginator
+from habits.permissions import IsOwner, IsOwnerOrPublic
+from habits.renderers import CSVRenderer, NDJSONRenderer
+from habits.serializers import (HabitBatchDeleteSerializer, HabitBatchUpdateSerializer, HabitCreateUpdateSerializer,
+                                HabitListSerializer, HabitDetailSerializer, HabitSearchSerializer, SERVICE_FIELDS,
+                                ValuesSerializer, get_requested_fields)
+from habits.signals import habits_bulk_saved
+
+
+def get_query_fields(request, serializer_class, *extra):
+    """
+    Return the model fields to load for the fields of 'serializer_class' requested with the 'fields' query
+    parameter, or for all of its fields, together with the 'extra' fields the view itself needs.
+    """
+
+    fields = serializer_class.Meta.fields
+    return (*(get_requested_fields(request, fields) or fields), *extra)
+
+
+class ValuesListMixin:
+    """
+    List view mixin that serializes a page of rows read with QuerySet.values() by the view's serializer through
+    ValuesSerializer, which is what the lists read by clients in bulk are built from.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        data = ValuesSerializer(self.get_serializer()).to_representation(page)
+        return self.get_paginated_response(data)
 
 
 class HabitCreateView(generics.CreateAPIView):
@@ -22,7 +61,94 @@ class HabitCreateView(generics.CreateAPIView):
     permission_classes = (IsAuthenticated,)
 
 
-class PublicHabitsListApiView(generics.ListAPIView):
+class HabitBatchCreateView(generics.GenericAPIView):
+    """
+        API endpoint to create a batch of habits.
+
+        Required permissions: User must be authenticated.
+
+        The request body is a list of habit payloads. The batch is validated as a whole, with one query for all the
+        related habits it references, and written with one INSERT in one transaction. The response lists the
+        created habits in the order of the payloads, or the errors of every payload if any of them is invalid.
+
+        Attributes:
+            serializer_class (class): The serializer class for the habits of the batch.
+            permission_classes (tuple): The permission classes required to access this view.
+        """
+    serializer_class = HabitCreateUpdateSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            habits = serializer.save()
+            habits_bulk_saved(habits, created=True)
+        data = [{'id': habit.pk, **item} for habit, item in zip(habits, serializer.data)]
+        return Response(data, status=status.HTTP_201_CREATED)
+
+
+class HabitBatchUpdateView(generics.GenericAPIView):
+    """
+        API endpoint to update a batch of habits.
+
+        Required permissions: User must be authenticated. Only the user's own habits can be changed.
+
+        The request body is a list of partial habit payloads, each with the 'id' of the habit it changes. The batch
+        is validated as a whole, loading the habits and the related habits it references with one query each, and
+        written with one UPDATE in one transaction. The response lists the updated habits in the order of the
+        payloads, or the errors of every payload if any of them is invalid.
+
+        Attributes:
+            serializer_class (class): The serializer class for the habits of the batch.
+            permission_classes (tuple): The permission classes required to access this view.
+        """
+    serializer_class = HabitBatchUpdateSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        return Habit.objects.filter(owner=self.request.user).select_related('owner')
+
+    def patch(self, request, *args, **kwargs):
+        serializer = self.get_serializer(self.get_queryset(), data=request.data, many=True, partial=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            habits = serializer.save()
+            habits_bulk_saved(habits, created=False)
+        return Response(serializer.data)
+
+
+class HabitBatchDeleteView(generics.GenericAPIView):
+    """
+        API endpoint to delete a batch of habits.
+
+        Required permissions: User must be authenticated. Only the user's own habits can be deleted.
+
+        The request body is a list of {"id": ...} items. The habits are deleted in one transaction if all of them
+        are found, and the response lists their ids in the order of the items; otherwise nothing is deleted and the
+        response has the errors of every item.
+
+        Attributes:
+            serializer_class (class): The serializer class for the items of the batch.
+            permission_classes (tuple): The permission classes required to access this view.
+        """
+    serializer_class = HabitBatchDeleteSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        return Habit.objects.filter(owner=self.request.user)
+
+    def delete(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        serializer = self.get_serializer(queryset, data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        habit_ids = [item['id'].pk for item in serializer.validated_data]
+        with transaction.atomic():
+            queryset.filter(pk__in=habit_ids).delete()
+        return Response([{'id': habit_id} for habit_id in habit_ids])
+
+
+class PublicHabitsListApiView(ValuesListMixin, generics.ListAPIView):
     """
        API endpoint to retrieve a list of public habits.
 
@@ -30,23 +156,88 @@ class PublicHabitsListApiView(generics.ListAPIView):
 
        Attributes:
            serializer_class (class): The serializer class for listing habits.
+           pagination_class (class): The paginator class for paginating the list from the cached public feed.
            permission_classes (tuple): The permission classes required to access this view.
+           filter_backends (tuple): The filter backends for filtering and ordering the list.
+           filter_indexes (dict): The supported combinations of filters and ordering and their indexes.
        """
     serializer_class = HabitListSerializer
+    pagination_class = PublicHabitPaginator
     permission_classes = (IsAuthenticated,)
+    filter_backends = (IndexedHabitFilter,)
+    filter_indexes = {
+        ((), 'id'): 'habits_public_idx',
+        (('periodicity',), 'id'): 'habits_public_periodicity_idx',
+        (('is_pleasant',), 'id'): 'habits_public_pleasant_idx',
+        ((), 'time'): 'habits_public_time_idx',
+        (('time',), 'time'): 'habits_public_time_idx',
+    }
+
+    def list(self, request, *args, **kwargs):
+        """
+                Return a page of the cached public feed without the current user's habits.
+
+                Filtered or ordered lists are read from the database instead.
+                """
+        if IndexedHabitFilter.is_filtered(request):
+            return super().list(request, *args, **kwargs)
+        page = self.paginator.paginate_feed(request)
+        fields = get_requested_fields(request, HabitListSerializer.Meta.fields)
+        if fields is not None:
+            page = [{field: habit[field] for field in fields} for habit in page]
+        return self.get_paginated_response(page)
 
     def get_queryset(self):
         """
                 Retrieve the list of public habits.
 
                 Returns:
-                    QuerySet: The queryset of public habits excluding those owned by the current user.
+                    QuerySet: The values() rows of public habits excluding those owned by the current user.
                 """
-        queryset = Habit.objects.filter(is_public=True).exclude(owner=self.request.user)
+        queryset = (
+            Habit.objects.filter(is_public=True).exclude(owner=self.request.user)
+            .values(*get_query_fields(self.request, HabitListSerializer, 'id', 'time'))
+        )
         return queryset
 
 
-class OwnHabitsListApiView(generics.ListAPIView):
+class HabitSearchApiView(ValuesListMixin, generics.ListAPIView):
+    """
+       API endpoint to search public habits by their action and location.
+
+       Required permissions: User must be authenticated.
+
+       The text of the 'q' query parameter is matched with PostgreSQL full-text search and trigram similarity, and
+       the results are ordered by relevance. The current user's own habits are left out, as in the public list.
+
+       Attributes:
+           serializer_class (class): The serializer class for search results.
+           pagination_class (class): The paginator class for paginating the results.
+           permission_classes (tuple): The permission classes required to access this view.
+       """
+    serializer_class = HabitSearchSerializer
+    pagination_class = HabitSearchPaginator
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        """
+                Search the public habits of other users.
+
+                Returns:
+                    QuerySet: The values() rows of matching public habits, most relevant first.
+                """
+        text = self.request.query_params.get('q', '').strip()
+        if not text:
+            raise ValidationError({'q': 'This query parameter is required.'})
+        queryset = (
+            Habit.objects.filter(is_public=True).exclude(owner=self.request.user)
+            .search(text)
+            .values(*get_query_fields(self.request, HabitSearchSerializer))
+        )
+        return queryset
+
+
+class OwnHabitsListApiView(ValuesListMixin, generics.ListAPIView):
     """
         API endpoint to retrieve a list of habits owned by the authenticated user.
 
@@ -56,23 +247,43 @@ class OwnHabitsListApiView(generics.ListAPIView):
             serializer_class (class): The serializer class for listing habits.
             pagination_class (class): The paginator class for paginating the list.
             permission_classes (tuple): The permission classes required to access this view.
+            filter_backends (tuple): The filter backends for filtering and ordering the list.
+            filter_indexes (dict): The supported combinations of filters and ordering and their indexes.
         """
     serializer_class = HabitListSerializer
     pagination_class = HabitPaginator
     permission_classes = (IsAuthenticated,)
+    filter_backends = (IndexedHabitFilter,)
+    filter_indexes = {
+        ((), 'id'): 'habits_owner_id_idx',
+        (('periodicity',), 'id'): 'habits_owner_periodicity_idx',
+        (('is_pleasant',), 'id'): 'habits_owner_pleasant_idx',
+        (('is_public',), 'id'): 'habits_owner_public_idx',
+        ((), 'time'): 'habits_owner_time_idx',
+        (('time',), 'time'): 'habits_owner_time_idx',
+    }
 
     def get_queryset(self):
         """
         Retrieve the list of habits owned by the authenticated user.
 
         Returns:
-            QuerySet: The queryset of habits owned by the current user.
+            QuerySet: The values() rows of habits owned by the current user.
         """
-        queryset = Habit.objects.filter(owner=self.request.user)
-        if not queryset:
-            return []
+        queryset = Habit.objects.filter(owner=self.request.user).values(
+            *get_query_fields(self.request, HabitListSerializer, 'id', 'time')
+        )
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        """
+        Return the requested page of the user's habits, from the cache while the user's habits are unchanged.
+        """
+        list_page = super().list
+        data = OwnHabitsCache(request.user.pk).get_page(request.build_absolute_uri(),
+                                                        lambda: list_page(request, *args, **kwargs).data)
+        return Response(data)
+
 
 class HabitDetailView(generics.RetrieveAPIView):
     """
@@ -80,25 +291,60 @@ class HabitDetailView(generics.RetrieveAPIView):
 
     Required permissions: User must have appropriate permissions based on habit visibility (public or owner).
 
+    The habit is loaded with one query that reads only the columns of the requested fields. Responses carry a strong
+    ETag of the habit's version and the user's view of it, and a request whose If-None-Match matches it gets 304 Not
+    Modified without serialization.
+
     Attributes:
         serializer_class (class): The serializer class for displaying habit details.
         queryset (QuerySet): The queryset of all habits.
+        permission_classes (tuple): The permission classes required to access this view.
     """
     serializer_class = HabitDetailSerializer
     queryset = Habit.objects.all()
+    permission_classes = (IsAuthenticated, IsOwnerOrPublic)
 
-    def get_permissions(self):
+    def get_queryset(self):
+        """
+        Load only the columns of the requested fields and those needed to decide the habit's visibility.
+        """
+        fields = [field.name for field in Habit._meta.get_fields()
+                  if field.concrete and field.name not in SERVICE_FIELDS]
+        requested = get_requested_fields(self.request, fields) or fields
+        return Habit.objects.only(*requested, 'owner', 'is_public', 'updated_at')
 
+    def get_object(self):
         try:
-            habit = Habit.objects.get(pk=self.kwargs.get('pk'))
-        except Habit.DoesNotExist:
+            return super().get_object()
+        except Http404:
             raise NotFound("Привычка не найдена")
 
-        if habit.is_public:
-            permission_classes = (IsAuthenticated,)
-        else:
-            permission_classes = (IsOwner,)
-        return (permission() for permission in permission_classes)
+    def retrieve(self, request, *args, **kwargs):
+        habit = self.get_object()
+        etag = self.get_etag(habit)
+        headers = {'ETag': etag}
+
+        # If-None-Match uses the weak comparison, and compressed responses carry the ETag as a weak one.
+        if_none_match = {tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))}
+        if '*' in if_none_match or etag in if_none_match:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        serializer = self.get_serializer(habit)
+        return Response(serializer.data, headers=headers)
+
+    def get_etag(self, habit):
+        """
+        Return the ETag of the habit's representation for the current user.
+
+        The owner and other users see different fields of a habit, so the ETag covers the version of the habit, its
+        'updated_at', which of the two views is returned and the fields requested.
+        """
+
+        view = 'owner' if habit.owner_id == self.request.user.pk else 'public'
+        fields = self.request.query_params.get('fields')
+        if fields is not None:
+            view += '-' + hashlib.md5(fields.encode()).hexdigest()[:12]
+        return quote_etag(f'{habit.pk}-{habit.updated_at.timestamp():.6f}-{view}')
 
 
 class HabitUpdateView(generics.UpdateAPIView):
@@ -129,3 +375,43 @@ class HabitDeleteView(generics.DestroyAPIView):
       """
     queryset = Habit.objects.all()
     permission_classes = (IsOwner,)
+
+
+class HabitExportView(APIView):
+    """
+      API endpoint to export all habits of the authenticated user as NDJSON or CSV.
+
+      Required permissions: User must be authenticated.
+
+      The format is chosen with the 'format' query parameter or the Accept header, NDJSON by default. The habits are
+      streamed from a server-side cursor as they are read, so the response starts at once and the memory used does
+      not grow with the number of habits.
+
+      Attributes:
+          permission_classes (tuple): The permission classes required to access this view.
+          renderer_classes (tuple): The renderer classes of the export formats.
+      """
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = (NDJSONRenderer, CSVRenderer)
+
+    def get(self, request):
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(export_habits(Habit.objects.filter(owner=request.user), renderer),
+                                         content_type=f'{renderer.media_type}; charset={renderer.charset}')
+        response['Content-Disposition'] = f'attachment; filename="habits.{renderer.format}"'
+        return response
+
+
+class NotificationMetricsView(APIView):
+    """
+      API endpoint exposing the metrics of the notification pipeline in the Prometheus text format.
+
+      Required permissions: User must be an admin.
+
+      Attributes:
+          permission_classes (tuple): The permission classes required to access this view.
+      """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.6 on 2026-10-18 11:14
+
+from django.db import migrations
+import timezone_field.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_user_chat_id_alter_user_telegram_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='timezone',
+            field=timezone_field.fields.TimeZoneField(default='UTC', verbose_name='Time zone'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.db import models
+from timezone_field import TimeZoneField
 
 
 class User(AbstractUser):
@@ -12,6 +13,7 @@ class User(AbstractUser):
     username = models.CharField(db_index=True, max_length=255, unique=True, validators=[UnicodeUsernameValidator()])
     telegram_id = models.CharField(db_index=True, max_length=255, unique=True, verbose_name='telegram_login')
     chat_id = models.CharField(verbose_name='telegram_chat_id', blank=True, null=True)
+    timezone = TimeZoneField(default='UTC', verbose_name='Time zone')
 
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = []